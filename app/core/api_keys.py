@@ -0,0 +1,129 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlmodel import Session, select
+
+from ..models import ApiKey
+from .cache import VersionedCache
+
+load_dotenv()
+
+API_KEYS_CACHE = "api_keys"
+
+# Llave única heredada: solo se acepta mientras no haya llaves registradas
+INTEGRATION_API_KEY = os.getenv("INTEGRATION_API_KEY", "SECRET123")
+INTEGRATION_RATE_PER_SECOND = float(os.getenv("INTEGRATION_RATE_PER_SECOND", "10"))
+INTEGRATION_BURST = int(os.getenv("INTEGRATION_BURST", "20"))
+
+# Secreto de administración para /api-keys: sin valor, la gestión por HTTP queda deshabilitada
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+
+
+@dataclass(frozen=True)
+class ApiKeyRef:
+    id: int            # 0 = llave heredada del .env
+    nombre: str
+    rate_per_second: float
+    burst: int
+
+
+def hash_api_key(raw: str) -> str:
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def generate_api_key() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def is_admin_key(raw: str) -> bool:
+    return bool(ADMIN_API_KEY) and secrets.compare_digest(raw.encode(), ADMIN_API_KEY.encode())
+
+
+def _load_api_keys(session: Session) -> Dict[str, ApiKeyRef]:
+    rows = session.exec(select(ApiKey).where(ApiKey.activo == True)).all()  # noqa: E712
+    keys = {
+        r.key_hash: ApiKeyRef(r.id, r.nombre, r.rate_per_second, r.burst)
+        for r in rows
+    }
+    has_keys = session.exec(select(ApiKey.id).limit(1)).first() is not None
+    if not has_keys and INTEGRATION_API_KEY:
+        keys[hash_api_key(INTEGRATION_API_KEY)] = ApiKeyRef(
+            0, "env", INTEGRATION_RATE_PER_SECOND, INTEGRATION_BURST
+        )
+    return keys
+
+
+api_key_index: VersionedCache[Dict[str, ApiKeyRef]] = VersionedCache(API_KEYS_CACHE, _load_api_keys)
+
+
+def authenticate(session: Session, raw: str) -> Optional[ApiKeyRef]:
+    """Busca la llave en la caché del proceso (sin consulta salvo al comprobar la versión)."""
+    return api_key_index.get(session).get(hash_api_key(raw))
+
+
+class TokenBucket:
+    """Token bucket en memoria: `rate` tokens por segundo hasta un máximo de `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp", "lock")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> float:
+        """Consume un token. Devuelve 0 si se permitió, o los segundos a esperar."""
+        with self.lock:
+            ahora = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (ahora - self.stamp) * self.rate)
+            self.stamp = ahora
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            if self.rate <= 0:
+                return 60.0
+            return (1 - self.tokens) / self.rate
+
+
+# Estado por proceso: un bucket y contadores de uso por llave
+_buckets: Dict[int, TokenBucket] = {}
+_usage: Dict[int, List] = {}          # id -> [permitidas, rechazadas, ultimo_uso]
+_guard = threading.Lock()
+
+
+def _bucket_for(ref: ApiKeyRef) -> TokenBucket:
+    bucket = _buckets.get(ref.id)
+    if bucket is None or bucket.rate != ref.rate_per_second or bucket.burst != ref.burst:
+        with _guard:
+            bucket = _buckets.get(ref.id)
+            if bucket is None or bucket.rate != ref.rate_per_second or bucket.burst != ref.burst:
+                bucket = TokenBucket(ref.rate_per_second, ref.burst)
+                _buckets[ref.id] = bucket
+    return bucket
+
+
+def consume(ref: ApiKeyRef) -> float:
+    """Aplica el límite de la llave y cuenta el uso. Devuelve los segundos a esperar (0 = permitido)."""
+    espera = _bucket_for(ref).take()
+    with _guard:
+        usage = _usage.setdefault(ref.id, [0, 0, None])
+        if espera:
+            usage[1] += 1
+        else:
+            usage[0] += 1
+            usage[2] = datetime.utcnow()
+    return espera
+
+
+def usage_snapshot() -> Dict[int, Tuple[int, int, Optional[datetime]]]:
+    with _guard:
+        return {kid: tuple(u) for kid, u in _usage.items()}
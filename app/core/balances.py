@@ -0,0 +1,175 @@
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import case, delete, insert, literal, update
+from sqlmodel import Session, select, func
+
+from ..models import Client, ClientBalance, LoyaltyLevel, PointsBag
+from .level_index import resolve_level
+
+load_dotenv()
+
+ALERT_DAYS_BEFORE = int(os.getenv("ALERT_DAYS_BEFORE", "3"))
+
+# Cantidad máxima de ids por cláusula IN
+CHUNK_SIZE = 500
+
+
+def _chunks(ids: List[int], size: int = CHUNK_SIZE):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+# Suma de bolsas vigentes por cliente (saldo total y saldo próximo a vencer)
+def _sumas_vigentes_stmt(hoy: date):
+    limite = hoy + timedelta(days=ALERT_DAYS_BEFORE)
+    return (
+        select(
+            PointsBag.cliente_id.label("cliente_id"),
+            func.sum(PointsBag.saldo_puntos).label("saldo_puntos"),
+            func.sum(
+                case((PointsBag.fecha_caducidad <= limite, PointsBag.saldo_puntos), else_=0)
+            ).label("puntos_por_vencer"),
+        )
+        .where(PointsBag.fecha_caducidad >= hoy)
+        .where(PointsBag.saldo_puntos > 0)
+        .group_by(PointsBag.cliente_id)
+    )
+
+
+def _resolve_level_id(session: Session, total: int) -> Optional[int]:
+    level = resolve_level(session, total)
+    return level.id if level else None
+
+
+def set_client_balance(session: Session, cliente_id: int, saldo: int, por_vencer: int) -> ClientBalance:
+    """Escribe el saldo ya calculado del cliente. No confirma la transacción."""
+    bal = session.get(ClientBalance, cliente_id)
+    if not bal:
+        bal = ClientBalance(cliente_id=cliente_id)
+    bal.saldo_puntos = saldo
+    bal.puntos_por_vencer = por_vencer
+    bal.level_id = _resolve_level_id(session, saldo)
+    bal.actualizado = datetime.utcnow()
+    session.add(bal)
+    return bal
+
+
+def refresh_client_balances(session: Session, cliente_ids: Iterable[int]) -> Dict[int, ClientBalance]:
+    """
+    Recalcula el saldo de los clientes indicados con una consulta agrupada por bloque.
+    Se llama desde cada operación que modifica bolsas, antes del commit del llamador.
+    """
+    ids = sorted(set(cliente_ids))
+    if not ids:
+        return {}
+
+    hoy = date.today()
+    sumas: Dict[int, Tuple[int, int]] = {cid: (0, 0) for cid in ids}
+    for chunk in _chunks(ids):
+        rows = session.exec(
+            _sumas_vigentes_stmt(hoy).where(PointsBag.cliente_id.in_(chunk))
+        ).all()
+        for cid, saldo, por_vencer in rows:
+            sumas[cid] = (int(saldo or 0), int(por_vencer or 0))
+
+        # carga los saldos existentes en el identity map para evitar un get() por cliente
+        session.exec(select(ClientBalance).where(ClientBalance.cliente_id.in_(chunk))).all()
+
+    return {cid: set_client_balance(session, cid, *v) for cid, v in sumas.items()}
+
+
+def refresh_client_balance(session: Session, cliente_id: int) -> ClientBalance:
+    return refresh_client_balances(session, [cliente_id])[cliente_id]
+
+
+def apply_balance_delta(session: Session, cliente_id: int, saldo: int, por_vencer: int) -> int:
+    """
+    Aplica una variación atómica al saldo materializado y devuelve el saldo resultante,
+    sin volver a sumar las bolsas. No confirma la transacción.
+    """
+    nuevo = session.execute(
+        update(ClientBalance)
+        .where(ClientBalance.cliente_id == cliente_id)
+        .values(
+            saldo_puntos=ClientBalance.saldo_puntos + saldo,
+            puntos_por_vencer=ClientBalance.puntos_por_vencer + por_vencer,
+            actualizado=datetime.utcnow(),
+        )
+        .returning(ClientBalance.saldo_puntos)
+    ).scalar_one_or_none()
+
+    if nuevo is None:
+        return refresh_client_balance(session, cliente_id).saldo_puntos
+
+    session.execute(
+        update(ClientBalance)
+        .where(ClientBalance.cliente_id == cliente_id)
+        .values(level_id=_resolve_level_id(session, nuevo))
+    )
+    return nuevo
+
+
+def get_client_balance(session: Session, cliente_id: int) -> ClientBalance:
+    """
+    Lectura del saldo por clave primaria. La migración carga todas las filas; si aun así
+    falta una (p. ej. cliente creado fuera de la API), se reconstruye aquí.
+    """
+    bal = session.get(ClientBalance, cliente_id)
+    if bal is None:
+        if not session.get(Client, cliente_id):
+            # cliente inexistente: saldo vacío sin persistir
+            return ClientBalance(cliente_id=cliente_id, level_id=_resolve_level_id(session, 0))
+        bal = refresh_client_balance(session, cliente_id)
+        session.commit()
+        session.refresh(bal)
+    return bal
+
+
+def refresh_levels(session: Session) -> None:
+    """Reasigna level_id de todos los saldos con un UPDATE por banda de nivel."""
+    levels = session.exec(
+        select(LoyaltyLevel).order_by(LoyaltyLevel.min_points, LoyaltyLevel.id)
+    ).all()
+
+    session.execute(update(ClientBalance).values(level_id=None))
+    for i, lvl in enumerate(levels):
+        stmt = update(ClientBalance).where(ClientBalance.saldo_puntos >= lvl.min_points)
+        if i + 1 < len(levels):
+            stmt = stmt.where(ClientBalance.saldo_puntos < levels[i + 1].min_points)
+        session.execute(stmt.values(level_id=lvl.id))
+
+
+def rebuild_balances(session: Session) -> int:
+    """
+    Reconstrucción completa de la tabla de saldos: carga inicial (revisión 7 de app.migrate)
+    y reparación con python -m app.core.balances. No confirma la transacción.
+    """
+    sumas = _sumas_vigentes_stmt(date.today()).subquery()
+
+    session.execute(delete(ClientBalance))
+    session.execute(
+        insert(ClientBalance).from_select(
+            ["cliente_id", "saldo_puntos", "puntos_por_vencer", "actualizado"],
+            select(
+                Client.id,
+                func.coalesce(sumas.c.saldo_puntos, 0),
+                func.coalesce(sumas.c.puntos_por_vencer, 0),
+                literal(datetime.utcnow()),
+            ).outerjoin(sumas, sumas.c.cliente_id == Client.id),
+        )
+    )
+    refresh_levels(session)
+    return session.exec(select(func.count()).select_from(ClientBalance)).one()
+
+
+# Uso: python -m app.core.balances
+if __name__ == "__main__":
+    from ..db import engine
+
+    with Session(engine) as session:
+        total = rebuild_balances(session)
+        session.commit()
+    print(f"Saldos reconstruidos: {total}")
@@ -0,0 +1,62 @@
+import os
+import time
+from typing import Callable, Generic, Optional, Tuple, TypeVar
+
+from dotenv import load_dotenv
+from sqlalchemy import update
+from sqlmodel import Session
+
+from ..models import CacheVersion
+
+load_dotenv()
+
+# Cada cuántos segundos un worker consulta la versión en la base
+CACHE_CHECK_SECONDS = float(os.getenv("CACHE_CHECK_SECONDS", "5"))
+
+T = TypeVar("T")
+
+
+def bump_cache_version(session: Session, nombre: str) -> None:
+    """Incrementa la versión de una caché. Va en la misma transacción que la escritura."""
+    result = session.execute(
+        update(CacheVersion)
+        .where(CacheVersion.nombre == nombre)
+        .values(version=CacheVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        session.add(CacheVersion(nombre=nombre, version=1))
+
+
+class VersionedCache(Generic[T]):
+    """
+    Valor calculado una vez por proceso y recalculado cuando cambia su versión en la base.
+    Las escrituras de este proceso llaman a invalidate() tras el commit; los demás workers
+    lo detectan en la siguiente comprobación de versión (cada CACHE_CHECK_SECONDS).
+
+    El estado se reemplaza con una sola asignación y no se toma ningún lock durante la
+    consulta: también se usa desde sesiones async (run_sync), donde un lock de hilo tomado
+    mientras se espera E/S bloquearía el event loop. Dos cargas simultáneas son inofensivas.
+    """
+
+    def __init__(self, nombre: str, loader: Callable[[Session], T]):
+        self.nombre = nombre
+        self._loader = loader
+        self._state: Optional[Tuple[T, int, float]] = None   # (valor, versión, última comprobación)
+
+    def get(self, session: Session) -> T:
+        state = self._state
+        if state and time.monotonic() - state[2] < CACHE_CHECK_SECONDS:
+            return state[0]
+
+        row = session.get(CacheVersion, self.nombre)
+        version = row.version if row else 0
+        if state and version == state[1]:
+            self._state = (state[0], version, time.monotonic())
+            return state[0]
+
+        value = self._loader(session)
+        self._state = (value, version, time.monotonic())
+        return value
+
+    def invalidate(self) -> None:
+        self._state = None
@@ -0,0 +1,202 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, func, select
+
+from ..db import engine
+from ..models import Client, ClientBalance, PointsBag
+from ..schemas import ClientCreate
+from .balances import refresh_client_balances
+from .level_index import resolve_level
+from .referrals import referral_bag_rows
+from .rollups import record_activity
+
+# Filas validadas que se insertan y confirman juntas
+IMPORT_CHUNK_SIZE = 1000
+# Errores detallados en la respuesta (el total se informa siempre)
+IMPORT_MAX_ERRORS = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.importados = 0
+        self.total_errores = 0
+        self.errores: List[Dict] = []
+
+    def error(self, fila: int, mensaje: str) -> None:
+        self.total_errores += 1
+        if len(self.errores) < IMPORT_MAX_ERRORS:
+            self.errores.append({"fila": fila, "error": mensaje})
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in exc.errors()
+    )
+
+
+# Los bytes que no son UTF-8 se reemplazan por este carácter y la fila se informa como error
+_INVALID_CHAR = "\ufffd"
+_INVALID_ENCODING = "La fila contiene bytes que no son UTF-8 (el archivo debe estar codificado en UTF-8)"
+
+
+# Filas crudas del archivo: (número de fila, dict) o (número de fila, mensaje de error)
+def _raw_rows(file: IO[bytes], formato: str) -> Iterator[Tuple[int, object]]:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    if formato == "csv":
+        reader = csv.DictReader(text)
+        for fila, row in enumerate(reader, start=1):
+            if any(_INVALID_CHAR in c for c in (*row, *row.values()) if isinstance(c, str)):
+                yield fila, _INVALID_ENCODING
+                continue
+            # celdas vacías = campo ausente; se ignoran columnas sobrantes
+            yield fila, {k: v for k, v in row.items() if k is not None and v not in ("", None)}
+        return
+
+    for fila, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        if _INVALID_CHAR in line:
+            yield fila, _INVALID_ENCODING
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield fila, "JSON inválido"
+            continue
+        yield fila, row if isinstance(row, dict) else "Se esperaba un objeto JSON"
+
+
+def _import_chunk(session: Session, chunk: List[Tuple[int, ClientCreate]], report: ImportReport) -> None:
+    documentos = {p.nro_documento for _, p in chunk}
+    emails = {p.email.lower() for _, p in chunk}
+    codigos = {p.codigo_referidor for _, p in chunk if p.codigo_referidor}
+
+    # Duplicados contra la base y referidores: una consulta IN por columna
+    doc_existentes = set(session.exec(
+        select(Client.nro_documento).where(Client.nro_documento.in_(documentos))
+    ).all())
+    email_existentes = set(session.exec(
+        select(func.lower(Client.email)).where(func.lower(Client.email).in_(emails))
+    ).all())
+    referidores: Dict[str, int] = dict(session.exec(
+        select(Client.referral_code, Client.id).where(Client.referral_code.in_(codigos))
+    ).all()) if codigos else {}
+
+    nuevos: List[Dict] = []
+    filas: List[int] = []
+    refs: List[Tuple[int, int]] = []        # (índice en `nuevos`, id del referidor)
+    for fila, p in chunk:
+        if p.nro_documento in doc_existentes:
+            report.error(fila, "Cliente duplicado (documento ya existe)")
+            continue
+        if p.email.lower() in email_existentes:
+            report.error(fila, "Cliente duplicado (email ya existe)")
+            continue
+        if p.codigo_referidor and p.codigo_referidor not in referidores:
+            report.error(fila, "Código de referidor inválido.")
+            continue
+
+        data = p.dict(exclude={"codigo_referidor"})
+        data["referral_code"] = uuid4().hex[:8]
+        if p.codigo_referidor:
+            refs.append((len(nuevos), referidores[p.codigo_referidor]))
+        nuevos.append(data)
+        filas.append(fila)
+        doc_existentes.add(p.nro_documento)
+        email_existentes.add(p.email.lower())
+
+    if not nuevos:
+        return
+
+    try:
+        _insert_chunk(session, nuevos, refs)
+        session.commit()
+    except IntegrityError:
+        # otro proceso insertó el mismo documento/email entre la validación y el insert
+        session.rollback()
+        for fila in filas:
+            report.error(fila, "Cliente duplicado (documento o email ya existe)")
+        return
+    report.importados += len(nuevos)
+
+
+# Inserta el lote, los vínculos y bonos de referidos y los saldos. No confirma la transacción.
+def _insert_chunk(
+    session: Session,
+    nuevos: List[Dict],
+    refs: List[Tuple[int, int]],
+) -> None:
+    ids = session.execute(
+        insert(Client).returning(Client.id, sort_by_parameter_order=True), nuevos
+    ).scalars().all()
+
+    # Referidos: vínculo con el referidor y bolsas del bono para ambos
+    hoy = date.today()
+    bolsas: List[Dict] = []
+    vinculos: List[Dict] = []
+    for idx, referidor_id in refs:
+        vinculos.append({"id": ids[idx], "referred_by_id": referidor_id})
+        bolsas.extend(referral_bag_rows(referidor_id, ids[idx], hoy))
+
+    if vinculos:
+        session.execute(update(Client), vinculos)
+    if bolsas:
+        session.execute(insert(PointsBag), bolsas)
+        record_activity(session, hoy, puntos_asignados=sum(b["puntos_asignados"] for b in bolsas))
+
+    # Saldos: se recalculan los clientes con bono (y sus referidores); el resto arranca en cero
+    con_bono = {b["cliente_id"] for b in bolsas}
+    nivel_inicial = resolve_level(session, 0)
+    ahora = datetime.utcnow()
+    sin_bono = [
+        dict(
+            cliente_id=cid,
+            saldo_puntos=0,
+            puntos_por_vencer=0,
+            level_id=nivel_inicial.id if nivel_inicial else None,
+            actualizado=ahora,
+        )
+        for cid in ids if cid not in con_bono
+    ]
+    if sin_bono:
+        session.execute(insert(ClientBalance), sin_bono)
+    refresh_client_balances(session, con_bono)
+
+
+def import_clients(file: IO[bytes], formato: str) -> ImportReport:
+    """
+    Importa clientes desde un archivo CSV (con cabecera) o NDJSON en una sola pasada.
+    Cada lote de IMPORT_CHUNK_SIZE filas válidas se inserta con executemany y se confirma
+    por separado; las filas inválidas se informan en el reporte sin detener la importación.
+    """
+    report = ImportReport()
+    chunk: List[Tuple[int, ClientCreate]] = []
+
+    with Session(engine) as session:
+        for fila, row in _raw_rows(file, formato):
+            if isinstance(row, str):
+                report.error(fila, row)
+                continue
+            try:
+                chunk.append((fila, ClientCreate.parse_obj(row)))
+            except ValidationError as exc:
+                report.error(fila, _validation_message(exc))
+                continue
+
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                _import_chunk(session, chunk, report)
+                chunk = []
+
+        if chunk:
+            _import_chunk(session, chunk, report)
+
+    report.errores.sort(key=lambda e: e["fila"])
+    return report
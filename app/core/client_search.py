@@ -0,0 +1,50 @@
+import re
+from typing import Optional
+
+from sqlalchemy import column, false, literal, literal_column, table
+from sqlmodel import Session, func, select
+
+from ..models import Client
+
+# Índices de búsqueda por nombre (los crea la revisión 4 de app/migrate.py)
+FTS_TABLE = "client_fts"           # SQLite: tabla virtual FTS5 sincronizada por triggers
+TRGM_INDEX = "ix_client_nombre_trgm"   # PostgreSQL: índice GIN pg_trgm
+
+_fts = table(FTS_TABLE, column("rowid"))
+
+
+# Consulta FTS5: cada palabra como prefijo entre comillas (sin operadores del usuario)
+def _fts_query(q: str) -> Optional[str]:
+    tokens = re.findall(r"\w+", q)
+    return " ".join(f'"{t}"*' for t in tokens) or None
+
+
+def client_matches(session: Session, q: str):
+    """
+    SELECT (cliente_id, rank) de los clientes cuyo nombre o apellido coincide con `q`;
+    menor rank = mejor coincidencia.
+    SQLite: prefijos de palabra en FTS5 ordenados por bm25. PostgreSQL: subcadena sobre el
+    índice trigram ordenada por similitud. Otros motores: subcadena sin índice.
+    """
+    dialect = session.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        query = _fts_query(q)
+        if not query:
+            return select(Client.id.label("cliente_id"), literal(0.0).label("rank")).where(false())
+        return (
+            select(
+                _fts.c.rowid.label("cliente_id"),
+                func.bm25(literal_column(FTS_TABLE)).label("rank"),
+            )
+            .select_from(_fts)
+            .where(literal_column(FTS_TABLE).op("MATCH")(query))
+        )
+
+    # misma expresión que el índice trigram
+    nombre = func.lower(Client.nombre + " " + Client.apellido)
+    ql = q.strip().lower()
+    rank = -func.similarity(nombre, ql) if dialect == "postgresql" else literal(0.0)
+    return select(Client.id.label("cliente_id"), rank.label("rank")).where(
+        nombre.contains(ql, autoescape=True)
+    )
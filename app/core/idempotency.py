@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from ..models import IdempotencyKey
+
+load_dotenv()
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# Vigencia de la reserva en proceso: pasado este tiempo se asume que el worker cayó
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60"))
+
+
+def _sha256(texto: str) -> str:
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+# Un lock por clave en este proceso: los duplicados simultáneos esperan al primero
+class _SingleFlight:
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: Dict[str, List[Any]] = {}   # clave -> [lock, usuarios]
+
+    def acquire(self, clave: str) -> threading.Lock:
+        with self._guard:
+            entry = self._locks.setdefault(clave, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+        return entry[0]
+
+    def release(self, clave: str) -> None:
+        with self._guard:
+            entry = self._locks[clave]
+            entry[0].release()
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[clave]
+
+
+_single_flight = _SingleFlight()
+
+
+def run_idempotent(
+    session: Session,
+    scope: str,
+    key: Optional[str],
+    request_data: Dict[str, Any],
+    handler: Callable[[], Dict[str, Any]],
+):
+    """
+    Ejecuta `handler` una sola vez por (scope, Idempotency-Key) y confirma la transacción.
+
+    El handler no hace commit: su escritura y la respuesta guardada se confirman juntas.
+    Un reintento con la misma clave recibe la respuesta original; si la primera solicitud
+    sigue en curso en este proceso, el duplicado la espera, y si está en otro worker se
+    responde 409 con Retry-After. Una reserva en proceso más antigua que
+    IDEMPOTENCY_LEASE_SECONDS (worker caído a mitad de la solicitud) la retoma el reintento.
+    Sin clave, se comporta como una llamada normal.
+    """
+    if not key:
+        data = handler()
+        session.commit()
+        return data
+
+    clave = _sha256(f"{scope}:{key}")
+    request_hash = _sha256(json.dumps(request_data, sort_keys=True, default=str))
+
+    _single_flight.acquire(clave)
+    try:
+        return _run(session, clave, request_hash, handler)
+    finally:
+        _single_flight.release(clave)
+
+
+def _en_proceso() -> HTTPException:
+    return HTTPException(409, "Solicitud en proceso.", headers={"Retry-After": "1"})
+
+
+# Condición sobre la reserva propia: otra solicitud pudo retomarla si venció
+def _reserva(clave: str, reclamada: Optional[datetime]):
+    return (
+        (IdempotencyKey.clave == clave)
+        & (IdempotencyKey.estado == "en_proceso")
+        & (IdempotencyKey.reclamada == reclamada if reclamada else IdempotencyKey.reclamada.is_(None))
+    )
+
+
+def _run(session: Session, clave: str, request_hash: str, handler: Callable[[], Dict[str, Any]]):
+    ahora = datetime.utcnow()
+
+    row = session.get(IdempotencyKey, clave)
+    if row and row.expira < ahora:
+        session.delete(row)
+        session.commit()
+        row = None
+
+    if row:
+        if row.request_hash != request_hash:
+            raise HTTPException(422, "La Idempotency-Key ya se usó con otra solicitud.")
+        if row.estado == "completado":
+            return JSONResponse(json.loads(row.respuesta), headers={"Idempotent-Replayed": "true"})
+        # reservas sin fecha (anteriores a la revisión 8) se consideran vencidas
+        if row.reclamada and row.reclamada + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS) > ahora:
+            raise _en_proceso()
+        # la solicitud original no terminó: se retoma la reserva si nadie se adelantó
+        result = session.execute(
+            update(IdempotencyKey)
+            .where(_reserva(clave, row.reclamada))
+            .values(reclamada=ahora)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            session.rollback()
+            raise _en_proceso()
+        session.commit()
+    else:
+        # Reserva la clave antes de ejecutar (visible para los demás workers)
+        session.add(IdempotencyKey(
+            clave=clave,
+            request_hash=request_hash,
+            expira=ahora + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+            reclamada=ahora,
+        ))
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            raise _en_proceso()
+
+    try:
+        data = handler()
+    except Exception:
+        # libera la clave para que el cliente pueda reintentar (si la reserva sigue siendo propia)
+        session.rollback()
+        session.execute(delete(IdempotencyKey).where(_reserva(clave, ahora)))
+        session.commit()
+        raise
+
+    # La respuesta se guarda junto con la escritura del handler; si la reserva venció y otra
+    # solicitud la retomó, esta se descarta para no aplicar la operación dos veces
+    result = session.execute(
+        update(IdempotencyKey)
+        .where(_reserva(clave, ahora))
+        .values(estado="completado", respuesta=json.dumps(data, default=str))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        session.rollback()
+        raise _en_proceso()
+    session.commit()
+    return data
+
+
+def purge_expired_keys(session: Session) -> int:
+    """Elimina las claves vencidas. No confirma la transacción."""
+    result = session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expira < datetime.utcnow())
+    )
+    return result.rowcount
@@ -0,0 +1,48 @@
+from bisect import bisect_right
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlmodel import Session, select
+
+from ..models import LoyaltyLevel
+from .cache import VersionedCache
+
+LEVELS_CACHE = "loyalty_levels"
+
+
+class LevelRef(NamedTuple):
+    id: int
+    name: str
+
+
+class CompiledLevels(NamedTuple):
+    thresholds: List[int]          # min_points ordenados (para bisección)
+    levels: List[LevelRef]
+    by_id: Dict[int, LevelRef]
+
+
+def _compile_levels(session: Session) -> CompiledLevels:
+    rows = session.exec(
+        select(LoyaltyLevel).order_by(LoyaltyLevel.min_points, LoyaltyLevel.id)
+    ).all()
+    levels = [LevelRef(l.id, l.name) for l in rows]
+    return CompiledLevels(
+        thresholds=[l.min_points for l in rows],
+        levels=levels,
+        by_id={l.id: l for l in levels},
+    )
+
+
+level_index: VersionedCache[CompiledLevels] = VersionedCache(LEVELS_CACHE, _compile_levels)
+
+
+def resolve_level(session: Session, total: int) -> Optional[LevelRef]:
+    """Nivel con el mayor min_points <= total."""
+    compiled = level_index.get(session)
+    i = bisect_right(compiled.thresholds, total) - 1
+    return compiled.levels[i] if i >= 0 else None
+
+
+def get_level(session: Session, level_id: Optional[int]) -> Optional[LevelRef]:
+    if level_id is None:
+        return None
+    return level_index.get(session).by_id.get(level_id)
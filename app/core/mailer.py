@@ -1,7 +1,11 @@
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
-from fastapi_mail.errors import ConnectionErrors
+import asyncio
+import time
+from datetime import date
+from email.message import EmailMessage
+from email.utils import formataddr
+import aiosmtplib
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional, Dict
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 
@@ -17,19 +21,14 @@ MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "True").lower() == "true"
 MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "False").lower() == "true"
 MAIL_USE_CREDENTIALS = os.getenv("MAIL_USE_CREDENTIALS", "True").lower() == "true"
 MAIL_VALIDATE_CERTS = os.getenv("MAIL_VALIDATE_CERTS", "True").lower() == "true"
+MAIL_CONCURRENCY = int(os.getenv("MAIL_CONCURRENCY", "4"))   # conexiones SMTP simultáneas en envíos masivos
+MAIL_TIMEOUT = int(os.getenv("MAIL_TIMEOUT", "60"))
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=MAIL_USERNAME,
-    MAIL_PASSWORD=MAIL_PASSWORD,
-    MAIL_FROM=MAIL_FROM,
-    MAIL_FROM_NAME=MAIL_FROM_NAME,
-    MAIL_PORT=MAIL_PORT,
-    MAIL_SERVER=MAIL_SERVER,
-    MAIL_STARTTLS=MAIL_STARTTLS,
-    MAIL_SSL_TLS=MAIL_SSL_TLS,
-    USE_CREDENTIALS=MAIL_USE_CREDENTIALS,
-    VALIDATE_CERTS=MAIL_VALIDATE_CERTS,
-)
+# Mensaje ya renderizado, listo para envío individual, masivo o para la bandeja de salida
+class OutgoingEmail(BaseModel):
+    to: str
+    subject: str
+    html: str
 
 class PointsAssignedEmail(BaseModel):
     to: EmailStr
@@ -39,7 +38,7 @@ class PointsAssignedEmail(BaseModel):
     fecha_caducidad: str   # YYYY-MM-DD
     monto_operacion: int
 
-async def send_points_assigned_email(data: PointsAssignedEmail):
+def render_points_assigned_email(data: PointsAssignedEmail) -> OutgoingEmail:
     html = f"""
     <div style="font-family:Arial,Helvetica,sans-serif">
       <h2>¡Puntos acreditados!</h2>
@@ -51,32 +50,41 @@ async def send_points_assigned_email(data: PointsAssignedEmail):
       <small>Gracias por tu preferencia.</small>
     </div>
     """
-
-    message = MessageSchema(
+    return OutgoingEmail(
+        to=data.to,
         subject="Puntos acreditados - Programa de Fidelización",
-        recipients=[data.to],
-        body=html,
-        subtype="html",
+        html=html,
     )
-    fm = FastMail(conf)
-    await fm.send_message(message)
-    
-def mail() -> FastMail:
-    return FastMail(conf)
+
+# correo: comprobante de canje
+def render_comprobante_email(
+    to_email: str,
+    cliente_nombre: str,
+    concepto: str,
+    puntos: int,
+    fecha: date,
+) -> OutgoingEmail:
+    html = f"""
+    <h3>¡Hola {cliente_nombre}!</h3>
+    <p>Tu canje se ha realizado correctamente.</p>
+    <ul>
+        <li><b>Concepto:</b> {concepto}</li>
+        <li><b>Puntos utilizados:</b> {puntos}</li>
+        <li><b>Fecha:</b> {fecha.strftime('%d/%m/%Y')}</li>
+    </ul>
+    <p>Gracias por participar en nuestro programa de fidelización.</p>
+    """
+    return OutgoingEmail(to=to_email, subject="Comprobante de Canje de Puntos", html=html)
 
 class PointsExpiringItem(BaseModel):
     fecha_caducidad: str  # "YYYY-MM-DD"
     puntos: int
 
-# correo: puntos próximos a vencer
-async def send_points_expiring_email(
-    to_email: EmailStr,
+def render_points_expiring_email(
+    to_email: str,
     cliente_nombre: str,
     items: List[PointsExpiringItem]
-):
-    if not to_email or not items:
-        return
-
+) -> OutgoingEmail:
     # construir el detalle y total
     total = sum(i.puntos for i in items)
     lines = "<br>".join(
@@ -93,11 +101,84 @@ async def send_points_expiring_email(
       <small>Usa tus beneficios antes del vencimiento.</small>
     </div>
     """
+    return OutgoingEmail(to=to_email, subject="Aviso: puntos próximos a vencer", html=html)
 
-    message = MessageSchema(
-        subject="Aviso: puntos próximos a vencer",
-        recipients=[to_email],
-        body=html,
-        subtype="html",
+# Envío masivo: cada worker abre una conexión SMTP y la reutiliza para varios mensajes
+async def _smtp_connect() -> aiosmtplib.SMTP:
+    smtp = aiosmtplib.SMTP(
+        hostname=MAIL_SERVER,
+        port=MAIL_PORT,
+        timeout=MAIL_TIMEOUT,
+        use_tls=MAIL_SSL_TLS,
+        start_tls=MAIL_STARTTLS,
+        validate_certs=MAIL_VALIDATE_CERTS,
     )
-    await mail().send_message(message)
\ No newline at end of file
+    await smtp.connect()
+    if MAIL_USE_CREDENTIALS:
+        await smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
+    return smtp
+
+async def _smtp_close(smtp: Optional[aiosmtplib.SMTP]) -> None:
+    if smtp is None:
+        return
+    try:
+        await smtp.quit()
+    except Exception:
+        smtp.close()
+
+def _mime(email: OutgoingEmail) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = formataddr((MAIL_FROM_NAME, MAIL_FROM))
+    msg["To"] = email.to
+    msg["Subject"] = email.subject
+    msg.set_content(email.html, subtype="html")
+    return msg
+
+async def send_bulk(
+    emails: List[OutgoingEmail],
+    concurrency: int = MAIL_CONCURRENCY,
+    rate_per_second: Optional[float] = None,
+) -> List[Optional[str]]:
+    """
+    Envía los mensajes con a lo sumo `concurrency` conexiones SMTP reutilizadas y, si se
+    indica, no más de `rate_per_second` mensajes por segundo.
+    Un fallo solo afecta a su destinatario: la conexión se descarta y se reabre para el
+    siguiente mensaje. Devuelve el error de cada mensaje, en el mismo orden (None = enviado).
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, e in enumerate(emails):
+        queue.put_nowait((i, e))
+
+    errores: List[Optional[str]] = [None] * len(emails)
+    intervalo = 1 / rate_per_second if rate_per_second else 0.0
+    proximo_envio = time.monotonic()
+
+    async def esperar_turno():
+        nonlocal proximo_envio
+        if not intervalo:
+            return
+        ahora = time.monotonic()
+        turno = max(ahora, proximo_envio)
+        proximo_envio = turno + intervalo
+        if turno > ahora:
+            await asyncio.sleep(turno - ahora)
+
+    async def worker():
+        smtp = None
+        try:
+            while not queue.empty():
+                i, email = queue.get_nowait()
+                try:
+                    await esperar_turno()
+                    if smtp is None:
+                        smtp = await _smtp_connect()
+                    await smtp.send_message(_mime(email))
+                except Exception as error:
+                    errores[i] = str(error) or type(error).__name__
+                    await _smtp_close(smtp)
+                    smtp = None
+        finally:
+            await _smtp_close(smtp)
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(emails)))))
+    return errores
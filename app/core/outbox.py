@@ -0,0 +1,135 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from uuid import uuid4
+
+from dotenv import load_dotenv
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from ..db import engine
+from ..models import EmailOutbox
+from .mailer import OutgoingEmail, send_bulk
+
+load_dotenv()
+
+OUTBOX_INTERVAL_SECONDS = int(os.getenv("OUTBOX_INTERVAL_SECONDS", "30"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_INTENTOS = int(os.getenv("OUTBOX_MAX_INTENTOS", "5"))
+OUTBOX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_BACKOFF_SECONDS", "60"))
+OUTBOX_RATE_PER_SECOND = float(os.getenv("OUTBOX_RATE_PER_SECOND", "5"))
+# Tiempo que un lote queda reservado para el despachador que lo tomó
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+
+
+def enqueue_email(session: Session, email: OutgoingEmail, dedup_key: Optional[str] = None) -> None:
+    """Encola el correo en la transacción del llamador; se envía solo si esta se confirma."""
+    if dedup_key and session.exec(
+        select(EmailOutbox.id).where(EmailOutbox.dedup_key == dedup_key)
+    ).first():
+        return
+    session.add(EmailOutbox(
+        destinatario=email.to,
+        asunto=email.subject,
+        cuerpo=email.html,
+        dedup_key=dedup_key,
+    ))
+
+
+def enqueue_emails(session: Session, emails: List[Tuple[OutgoingEmail, str]]) -> None:
+    """Encola varios correos (con su dedup_key) comprobando duplicados con una sola consulta."""
+    if not emails:
+        return
+    existentes = set(session.exec(
+        select(EmailOutbox.dedup_key).where(EmailOutbox.dedup_key.in_([k for _, k in emails]))
+    ).all())
+    session.add_all([
+        EmailOutbox(destinatario=e.to, asunto=e.subject, cuerpo=e.html, dedup_key=k)
+        for e, k in emails if k not in existentes
+    ])
+
+
+# Reserva un lote de pendientes vencidos para este despachador
+def _claim_batch() -> List[Tuple[int, int, OutgoingEmail]]:
+    ahora = datetime.utcnow()
+    lote = uuid4().hex
+    with Session(engine) as session:
+        ids = session.exec(
+            select(EmailOutbox.id)
+            .where(EmailOutbox.estado == "pendiente")
+            .where(EmailOutbox.proximo_intento <= ahora)
+            .order_by(EmailOutbox.id)
+            .limit(OUTBOX_BATCH_SIZE)
+        ).all()
+        if not ids:
+            return []
+
+        # la condición sobre proximo_intento evita que dos workers tomen la misma fila
+        session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(ids))
+            .where(EmailOutbox.estado == "pendiente")
+            .where(EmailOutbox.proximo_intento <= ahora)
+            .values(lote=lote, proximo_intento=ahora + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+
+        rows = session.exec(
+            select(EmailOutbox).where(EmailOutbox.lote == lote).order_by(EmailOutbox.id)
+        ).all()
+        return [
+            (r.id, r.intentos, OutgoingEmail(to=r.destinatario, subject=r.asunto, html=r.cuerpo))
+            for r in rows
+        ]
+
+
+# Marca enviados y reprograma fallidos con espera exponencial
+def _record_results(claimed: List[Tuple[int, int, OutgoingEmail]], errores: List[Optional[str]]) -> None:
+    ahora = datetime.utcnow()
+    with Session(engine) as session:
+        enviados = [oid for (oid, _, _), error in zip(claimed, errores) if not error]
+        if enviados:
+            session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(enviados))
+                .values(estado="enviado", enviado=ahora, lote=None, ultimo_error=None)
+                .execution_options(synchronize_session=False)
+            )
+
+        for (oid, intentos, _), error in zip(claimed, errores):
+            if not error:
+                continue
+            intentos += 1
+            session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id == oid)
+                .values(
+                    estado="fallido" if intentos >= OUTBOX_MAX_INTENTOS else "pendiente",
+                    intentos=intentos,
+                    ultimo_error=error[:500],
+                    proximo_intento=ahora + timedelta(seconds=OUTBOX_BACKOFF_SECONDS * 2 ** (intentos - 1)),
+                    lote=None,
+                )
+                .execution_options(synchronize_session=False)
+            )
+        session.commit()
+
+
+async def dispatch_outbox() -> Tuple[int, int]:
+    """Vacía la bandeja de salida por lotes. Devuelve (enviados, fallidos)."""
+    enviados = fallidos = 0
+    while True:
+        claimed = await asyncio.to_thread(_claim_batch)
+        if not claimed:
+            break
+
+        errores = await send_bulk([e for _, _, e in claimed], rate_per_second=OUTBOX_RATE_PER_SECOND)
+        await asyncio.to_thread(_record_results, claimed, errores)
+
+        fallidos += sum(1 for e in errores if e)
+        enviados += sum(1 for e in errores if not e)
+        if len(claimed) < OUTBOX_BATCH_SIZE:
+            break
+    return enviados, fallidos
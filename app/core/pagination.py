@@ -0,0 +1,96 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import tuple_
+from sqlmodel import Session
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+# Cursor opaco: lista de valores de la clave de orden de la última fila devuelta
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[List[Any]]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise HTTPException(400, "Cursor inválido.")
+    if not isinstance(values, list):
+        raise HTTPException(400, "Cursor inválido.")
+    return values
+
+
+def set_page_headers(
+    request: Request,
+    response: Response,
+    next_cursor: Optional[str],
+    total: Optional[int] = None,
+) -> None:
+    """Publica el total y el enlace a la página siguiente en las cabeceras de la respuesta."""
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+    if next_cursor:
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+
+# Convierte un valor del cursor (JSON) al tipo de la columna de orden
+def _cursor_value(col, value: Any) -> Any:
+    try:
+        python_type = col.type.python_type
+    except NotImplementedError:
+        return value
+    try:
+        if python_type is datetime:
+            return datetime.fromisoformat(value)
+        if python_type is date:
+            return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise HTTPException(400, "Cursor inválido.")
+    return value
+
+
+def keyset_page(
+    session: Session,
+    request: Request,
+    response: Response,
+    stmt,
+    order: Sequence,
+    limit: int,
+    cursor: Optional[str],
+    descending: bool = False,
+) -> list:
+    """
+    Página de entidades ordenada por las columnas `order` (la última debe ser única, p. ej. id).
+    Continúa desde el cursor con una comparación de tupla sobre la clave de orden, así una
+    página profunda cuesta lo mismo que la primera. Publica el cursor siguiente en las cabeceras.
+    """
+    after = decode_cursor(cursor)
+    if after:
+        if len(after) != len(order):
+            raise HTTPException(400, "Cursor inválido.")
+        valores = [_cursor_value(col, v) for col, v in zip(order, after)]
+        clave = tuple_(*order) if len(order) > 1 else order[0]
+        desde = tuple_(*valores) if len(order) > 1 else valores[0]
+        stmt = stmt.where(clave < desde if descending else clave > desde)
+
+    orden = [col.desc() for col in order] if descending else list(order)
+    rows = session.exec(stmt.order_by(*orden).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        ultima = rows[limit - 1]
+        next_cursor = encode_cursor([getattr(ultima, col.key) for col in order])
+    set_page_headers(request, response, next_cursor)
+    return rows[:limit]
@@ -0,0 +1,123 @@
+from datetime import date, timedelta
+from typing import List, NamedTuple
+
+from fastapi import HTTPException
+from sqlalchemy import insert, update
+from sqlmodel import Session, select
+
+from ..models import ClientBalance, PointConcept, PointsBag, PointsUseDetail, PointsUseHeader
+from .balances import ALERT_DAYS_BEFORE, apply_balance_delta
+from .rollups import record_activity
+
+
+class RedemptionResult(NamedTuple):
+    cabecera: PointsUseHeader
+    saldo_restante: int
+
+
+# Concepto usado por los canjes de productos (que no tienen concepto propio)
+def default_concept_id(session: Session) -> int:
+    concepto = session.exec(select(PointConcept).order_by(PointConcept.id)).first()
+    if not concepto:
+        raise HTTPException(status_code=500, detail="Debe existir al menos un concepto")
+    return concepto.id
+
+
+# Toma el lock de escritura antes de leer las bolsas: en SQLite un UPDATE abre la transacción
+# de escritura (como BEGIN IMMEDIATE) y en PostgreSQL bloquea la fila del saldo del cliente,
+# así los canjes concurrentes del mismo cliente se ejecutan uno detrás de otro
+def _lock_client(session: Session, cliente_id: int) -> None:
+    session.execute(
+        update(ClientBalance)
+        .where(ClientBalance.cliente_id == cliente_id)
+        .values(saldo_puntos=ClientBalance.saldo_puntos)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def redeem_points(session: Session, cliente_id: int, concepto_id: int, puntos: int) -> RedemptionResult:
+    """
+    Consume `puntos` de las bolsas vigentes del cliente en orden FIFO.
+
+    Antes de leer las bolsas se toma el lock de escritura (ver _lock_client) y las candidatas
+    se bloquean con SELECT ... FOR UPDATE donde el motor lo soporta. Cada descuento se aplica
+    con un UPDATE condicionado a que la bolsa conserve saldo suficiente; si aun así otra
+    transacción la gastó, se responde 409 sin deshacer nada: el llamador es dueño de la
+    transacción (rollback o commit). Cabecera, detalles, bolsas y saldo materializado quedan
+    en la misma transacción.
+    """
+    hoy = date.today()
+    limite_aviso = hoy + timedelta(days=ALERT_DAYS_BEFORE)
+
+    _lock_client(session, cliente_id)
+
+    # Bolsas activas (FIFO)
+    bolsas: List[PointsBag] = session.exec(
+        select(PointsBag)
+        .where(PointsBag.cliente_id == cliente_id)
+        .where(PointsBag.saldo_puntos > 0)
+        .where(PointsBag.fecha_caducidad >= hoy)
+        .order_by(PointsBag.fecha_asignacion.asc(), PointsBag.id.asc())
+        .with_for_update()
+    ).all()
+
+    # un producto sin costo (points_required=0) se canjea aunque no haya bolsas
+    if not bolsas and puntos > 0:
+        raise HTTPException(400, "El cliente no tiene puntos disponibles.")
+
+    saldo_total = sum(b.saldo_puntos for b in bolsas)
+    if saldo_total < puntos:
+        raise HTTPException(
+            400,
+            f"Puntos insuficientes. Requerido: {puntos}, disponible: {saldo_total}.",
+        )
+
+    # Plan de consumo FIFO
+    consumos = []
+    restante = puntos
+    for bolsa in bolsas:
+        if restante <= 0:
+            break
+        usar = min(bolsa.saldo_puntos, restante)
+        consumos.append((bolsa, usar))
+        restante -= usar
+
+    # Descuento condicionado: con el lock tomado no debería fallar, pero nunca deja saldo negativo
+    for bolsa, usar in consumos:
+        result = session.execute(
+            update(PointsBag)
+            .where(PointsBag.id == bolsa.id)
+            .where(PointsBag.saldo_puntos >= usar)
+            .values(
+                saldo_puntos=PointsBag.saldo_puntos - usar,
+                puntos_utilizados=PointsBag.puntos_utilizados + usar,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            raise HTTPException(409, "Las bolsas del cliente cambiaron durante el canje. Intente nuevamente.")
+
+    cabecera = PointsUseHeader(
+        cliente_id=cliente_id,
+        concepto_id=concepto_id,
+        puntaje_utilizado=puntos,
+        fecha=hoy,
+    )
+    session.add(cabecera)
+    session.flush()
+
+    # sin consumos (canje de 0 puntos) no hay detalles: una lista vacía haría INSERT ... DEFAULT VALUES
+    if consumos:
+        session.execute(
+            insert(PointsUseDetail),
+            [
+                {"cabecera_id": cabecera.id, "bolsa_id": bolsa.id, "puntaje_utilizado": usar}
+                for bolsa, usar in consumos
+            ],
+        )
+
+    por_vencer = sum(usar for bolsa, usar in consumos if bolsa.fecha_caducidad <= limite_aviso)
+    saldo = apply_balance_delta(session, cliente_id, -puntos, -por_vencer)
+    record_activity(session, hoy, puntos_canjeados=puntos, canjes=1)
+
+    return RedemptionResult(cabecera=cabecera, saldo_restante=saldo)
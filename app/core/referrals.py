@@ -0,0 +1,23 @@
+from datetime import date, timedelta
+from typing import Dict, List
+
+BONUS_REFERENTE = 20  # Puntos para quien refiere
+BONUS_REFERIDO = 10   # Puntos para el nuevo cliente
+VIGENCIA_BONUS_DIAS = 365  # 1 año de vigencia
+
+
+def referral_bag_rows(referidor_id: int, referido_id: int, hoy: date) -> List[Dict]:
+    """Valores de las dos bolsas del bono de referidos (referidor y nuevo cliente)."""
+    fecha_cad = hoy + timedelta(days=VIGENCIA_BONUS_DIAS)
+    return [
+        dict(
+            cliente_id=cliente_id,
+            fecha_asignacion=hoy,
+            fecha_caducidad=fecha_cad,
+            puntos_asignados=puntos,
+            puntos_utilizados=0,
+            saldo_puntos=puntos,
+            monto_operacion=0,
+        )
+        for cliente_id, puntos in ((referidor_id, BONUS_REFERENTE), (referido_id, BONUS_REFERIDO))
+    ]
@@ -0,0 +1,182 @@
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+load_dotenv()
+
+# Vigencia de las respuestas del dashboard (0 desactiva la caché)
+DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "30"))
+# Al superar este número de entradas se descartan las vencidas
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "1000"))
+
+# Tablas modificadas en la transacción en curso (se invalidan al confirmar)
+_SESSION_KEY = "response_cache_tablas"
+
+
+class ResponseCache:
+    """
+    Resultados calculados por clave, con vencimiento (TTL) y etiquetas.
+
+    - Las etiquetas son nombres de tabla: al confirmar una transacción que escribió en una
+      tabla se descartan las entradas que la usan (ver los listeners al final del módulo).
+    - Un solo cálculo por clave a la vez: las peticiones que llegan durante un fallo esperan
+      el resultado en lugar de repetir la consulta.
+    - La invalidación es por proceso; en los otros workers la entrada vive hasta su TTL.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, Tuple[Any, float, frozenset]] = {}   # (valor, vence, etiquetas)
+        self._by_tag: Dict[str, Set[Hashable]] = defaultdict(set)
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self.hits = self.misses = self.invalidations = 0
+        self._per_key: Dict[str, list] = defaultdict(lambda: [0, 0])       # nombre -> [aciertos, fallos]
+
+    def _lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            return True, entry[0]
+        return False, None
+
+    def _count(self, key: Hashable, hit: bool) -> None:
+        nombre = key[0] if isinstance(key, tuple) else str(key)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._per_key[nombre][0 if hit else 1] += 1
+
+    def get_or_compute(self, key: Hashable, tags: Iterable[str], compute: Callable[[], Any]) -> Any:
+        if self.ttl <= 0:
+            return compute()
+
+        found, value = self._lookup(key)
+        if found:
+            self._count(key, True)
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # otro hilo pudo haberlo calculado mientras esperábamos
+            found, value = self._lookup(key)
+            if found:
+                self._count(key, True)
+                return value
+
+            self._count(key, False)
+            tags = frozenset(tags)
+            with self._lock:
+                generaciones = {t: self._generations[t] for t in tags}
+
+            value = compute()
+
+            with self._lock:
+                # si hubo escrituras durante el cálculo el resultado puede estar viejo: no se guarda
+                if all(self._generations[t] == g for t, g in generaciones.items()):
+                    self._entries[key] = (value, time.monotonic() + self.ttl, tags)
+                    for t in tags:
+                        self._by_tag[t].add(key)
+                    if len(self._entries) > self.max_entries:
+                        self._prune()
+            return value
+
+    # Descarta entradas vencidas y los locks de claves sin cálculo en curso (con _lock tomado)
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for key, (_, vence, tags) in list(self._entries.items()):
+            if vence <= now:
+                del self._entries[key]
+                for t in tags:
+                    self._by_tag[t].discard(key)
+        for key, lock in list(self._key_locks.items()):
+            if key not in self._entries and not lock.locked():
+                del self._key_locks[key]
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        with self._lock:
+            for t in tags:
+                self._generations[t] += 1
+                for key in self._by_tag.pop(t, ()):
+                    if self._entries.pop(key, None) is not None:
+                        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "ttl_seconds": self.ttl,
+                "entradas": len(self._entries),
+                "aciertos": self.hits,
+                "fallos": self.misses,
+                "invalidaciones": self.invalidations,
+                "tasa_aciertos": round(self.hits / total, 4) if total else None,
+                "por_endpoint": {
+                    k: {"aciertos": v[0], "fallos": v[1]} for k, v in sorted(self._per_key.items())
+                },
+            }
+
+    def cached(self, *tables: str) -> Callable:
+        """
+        Decorador para endpoints: la clave es el nombre de la función más sus parámetros
+        (sin la sesión). Las etiquetas son las tablas que lee el endpoint.
+        """
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                params = tuple(sorted(
+                    (k, v) for k, v in kwargs.items() if not isinstance(v, OrmSession)
+                ))
+                return self.get_or_compute(
+                    (func.__name__, params), tables, lambda: func(*args, **kwargs)
+                )
+            return wrapper
+        return decorator
+
+
+dashboard_cache = ResponseCache(DASHBOARD_CACHE_TTL_SECONDS, DASHBOARD_CACHE_MAX_ENTRIES)
+
+
+# ------------------------------------------------------
+# Invalidación por escritura: se anotan las tablas tocadas en la sesión y se
+# descartan las entradas solo cuando la transacción se confirma. Las marcas de una
+# transacción revertida se mantienen: a lo sumo provocan una invalidación de más
+# ------------------------------------------------------
+def _mark(session: OrmSession, table: Optional[str]) -> None:
+    if table:
+        session.info.setdefault(_SESSION_KEY, set()).add(table)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _after_flush(session: OrmSession, flush_context) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        _mark(session, table)
+
+
+# insert()/update()/delete() ejecutados con session.execute (cargas masivas, vencimientos)
+@event.listens_for(OrmSession, "do_orm_execute")
+def _do_orm_execute(state) -> None:
+    if not (state.is_insert or state.is_update or state.is_delete) or state.bind_mapper is None:
+        return
+    _mark(state.session, state.bind_mapper.local_table.name)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _after_commit(session: OrmSession) -> None:
+    tables = session.info.pop(_SESSION_KEY, None)
+    if tables:
+        dashboard_cache.invalidate_tags(tables)
+
@@ -0,0 +1,101 @@
+from collections import defaultdict
+from datetime import date
+from typing import Dict
+
+from sqlalchemy import Date, cast, delete, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, func, select
+
+from ..models import DailyStats, MonthlyStats, PointsBag, PointsUseHeader, Survey
+
+ROLLUP_COLUMNS = ("puntos_asignados", "puntos_canjeados", "canjes", "encuestas", "suma_puntuacion")
+
+
+def _mes(dia: date) -> str:
+    return dia.strftime("%Y-%m")
+
+
+# Suma los valores a la fila indicada, creándola si no existe
+def _add(session: Session, model, clave: str, valor, deltas: Dict[str, int]) -> None:
+    col = getattr(model, clave)
+    sumas = {k: getattr(model, k) + v for k, v in deltas.items()}
+    dialect = session.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        # upsert atómico: dos workers pueden crear la fila del mismo día a la vez
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = dialect_insert(model).values({clave: valor, **deltas})
+        session.execute(stmt.on_conflict_do_update(index_elements=[col], set_=sumas))
+        return
+
+    result = session.execute(update(model).where(col == valor).values(sumas))
+    if result.rowcount == 0:
+        session.execute(insert(model).values({clave: valor, **deltas}))
+
+
+def record_activity(session: Session, dia: date, **deltas: int) -> None:
+    """
+    Suma actividad a los acumulados del día y del mes (p. ej. puntos_asignados=50).
+    Va en la misma transacción que la escritura que la origina. No confirma la transacción.
+    """
+    deltas = {k: int(v) for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    _add(session, DailyStats, "fecha", dia, deltas)
+    _add(session, MonthlyStats, "mes", _mes(dia), deltas)
+
+
+# Día de una columna fecha/hora (CAST a DATE no sirve en SQLite)
+def _dia(session: Session, col):
+    if session.get_bind().dialect.name == "sqlite":
+        return func.date(col)
+    return cast(col, Date)
+
+
+def rebuild_rollups(session: Session) -> int:
+    """Recalcula los acumulados desde el historial completo (carga inicial o reparación)."""
+    dias: Dict[date, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(ROLLUP_COLUMNS, 0))
+
+    for dia, puntos in session.exec(
+        select(PointsBag.fecha_asignacion, func.sum(PointsBag.puntos_asignados))
+        .group_by(PointsBag.fecha_asignacion)
+    ).all():
+        dias[dia]["puntos_asignados"] += int(puntos or 0)
+
+    for dia, puntos, canjes in session.exec(
+        select(PointsUseHeader.fecha, func.sum(PointsUseHeader.puntaje_utilizado), func.count())
+        .group_by(PointsUseHeader.fecha)
+    ).all():
+        dias[dia]["puntos_canjeados"] += int(puntos or 0)
+        dias[dia]["canjes"] += canjes
+
+    dia_encuesta = _dia(session, Survey.fecha)
+    for dia, encuestas, suma in session.exec(
+        select(dia_encuesta, func.count(), func.sum(Survey.puntuacion)).group_by(dia_encuesta)
+    ).all():
+        if isinstance(dia, str):
+            dia = date.fromisoformat(dia)
+        dias[dia]["encuestas"] += encuestas
+        dias[dia]["suma_puntuacion"] += int(suma or 0)
+
+    meses: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(ROLLUP_COLUMNS, 0))
+    for dia, valores in dias.items():
+        for k, v in valores.items():
+            meses[_mes(dia)][k] += v
+
+    session.execute(delete(DailyStats))
+    session.execute(delete(MonthlyStats))
+    if dias:
+        session.execute(insert(DailyStats), [{"fecha": d, **v} for d, v in dias.items()])
+        session.execute(insert(MonthlyStats), [{"mes": m, **v} for m, v in meses.items()])
+    return len(dias)
+
+
+# Uso: python -m app.core.rollups
+if __name__ == "__main__":
+    from ..db import engine
+
+    with Session(engine) as session:
+        total = rebuild_rollups(session)
+        session.commit()
+    print(f"Acumulados reconstruidos: {total} días")
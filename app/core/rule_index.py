@@ -0,0 +1,66 @@
+from bisect import bisect_right
+from typing import List, NamedTuple, Optional
+
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+from ..models import Rule
+from .cache import VersionedCache
+
+RULES_CACHE = "rules"
+
+
+class CompiledRules(NamedTuple):
+    inferiores: List[int]          # límites inferiores ordenados (para bisección)
+    superiores: List[int]
+    equivalencias: List[int]
+    max_superior: List[int]        # máximo superior acumulado, para rangos solapados
+    general: Optional[int]         # equivalencia de respaldo precalculada
+
+
+def _compile_rules(session: Session) -> CompiledRules:
+    reglas: List[Rule] = list(session.exec(select(Rule).order_by(Rule.id)))
+
+    rangos = sorted(
+        (r for r in reglas if r.limite_inferior is not None and r.limite_superior is not None),
+        key=lambda r: (r.limite_inferior, r.id),
+    )
+    max_superior: List[int] = []
+    for r in rangos:
+        max_superior.append(max(r.limite_superior, max_superior[-1]) if max_superior else r.limite_superior)
+
+    # equivalencia general; en última instancia la primera regla
+    regla_general = next((r for r in reglas if r.limite_inferior is None and r.limite_superior is None), None)
+    if not regla_general and reglas:
+        regla_general = reglas[0]
+
+    return CompiledRules(
+        inferiores=[r.limite_inferior for r in rangos],
+        superiores=[r.limite_superior for r in rangos],
+        equivalencias=[r.equivalencia_monto for r in rangos],
+        max_superior=max_superior,
+        general=regla_general.equivalencia_monto if regla_general else None,
+    )
+
+
+rule_index: VersionedCache[CompiledRules] = VersionedCache(RULES_CACHE, _compile_rules)
+
+
+def puntos_por_monto(session: Session, monto: int) -> int:
+    """
+    Usa la regla de rango que contiene el monto (búsqueda binaria por límite inferior);
+    si ninguna coincide, usa la equivalencia general.
+    equivalencia_monto = cuántos puntos por cada X guaraníes.
+    """
+    rules = rule_index.get(session)
+
+    i = bisect_right(rules.inferiores, monto) - 1
+    # con rangos disjuntos el primer candidato es el único posible
+    while i >= 0 and rules.max_superior[i] >= monto:
+        if monto <= rules.superiores[i]:
+            return monto // rules.equivalencias[i]
+        i -= 1
+
+    if rules.general is None:
+        raise HTTPException(400, "No hay reglas de puntos configuradas.")
+    return monto // rules.general
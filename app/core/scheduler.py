@@ -1,3 +1,4 @@
+import asyncio
 import os
 from datetime import date, timedelta
 from collections import defaultdict
@@ -5,10 +6,14 @@ from collections import defaultdict
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from dotenv import load_dotenv
+from sqlalchemy import update
 from sqlmodel import Session, select
 
 from ..models import PointsBag, Client
-from ..core.mailer import send_points_expiring_email, PointsExpiringItem
+from ..core.mailer import OutgoingEmail, PointsExpiringItem, render_points_expiring_email, send_bulk
+from ..core.balances import refresh_client_balances
+from ..core.outbox import OUTBOX_INTERVAL_SECONDS, dispatch_outbox
+from ..core.idempotency import purge_expired_keys
 from ..db import engine  # Asegurate de exportar "engine" en app/db.py
 
 load_dotenv()
@@ -16,73 +21,143 @@ load_dotenv()
 ALERT_DAYS_BEFORE = int(os.getenv("ALERT_DAYS_BEFORE", "3"))
 ALERT_HOUR = int(os.getenv("ALERT_HOUR", "9"))
 ALERT_MINUTE = int(os.getenv("ALERT_MINUTE", "0"))
+EXPIRE_BATCH_SIZE = int(os.getenv("EXPIRE_BATCH_SIZE", "1000"))
 
-#Avisa el vencimiento de puntos mediante mails
-async def _job_points_expiring():
-    """Busca bolsas que vencen en los próximos N días y envía emails agrupados por cliente."""
-    today = date.today()
-    limit = today + timedelta(days=ALERT_DAYS_BEFORE)
-
+# Arma los avisos de vencimiento: bolsas proyectadas y clientes cargados con IN por bloques
+def _expiring_emails(today: date, limit: date) -> list[OutgoingEmail]:
     with Session(engine) as session:
         # bolsas con saldo > 0 que vencen dentro de la ventana
         bolsas = session.exec(
-            select(PointsBag)
+            select(PointsBag.cliente_id, PointsBag.fecha_caducidad, PointsBag.saldo_puntos)
             .where(
                 PointsBag.saldo_puntos > 0,
                 PointsBag.fecha_caducidad >= today,
                 PointsBag.fecha_caducidad <= limit,
             )
+            .order_by(PointsBag.cliente_id, PointsBag.fecha_caducidad)
         ).all()
 
         if not bolsas:
-            return
+            return []
 
         # agrupar por cliente
-        por_cliente: dict[int, list[PointsBag]] = defaultdict(list)
-        for b in bolsas:
-            por_cliente[b.cliente_id].append(b)
-
-        # enviar un correo por cliente
-        for cliente_id, lista in por_cliente.items():
-            cli = session.get(Client, cliente_id)
-            if not cli or not cli.email:
-                continue
-
-            items = [
-                PointsExpiringItem(
-                    fecha_caducidad=str(b.fecha_caducidad),
-                    puntos=b.saldo_puntos,
-                )
-                for b in sorted(lista, key=lambda x: x.fecha_caducidad)
-            ]
-
-            await send_points_expiring_email(
-                to_email=cli.email,
-                cliente_nombre=f"{cli.nombre} {cli.apellido}",
-                items=items,
+        por_cliente: dict[int, list[PointsExpiringItem]] = defaultdict(list)
+        for cliente_id, fecha_caducidad, saldo in bolsas:
+            por_cliente[cliente_id].append(
+                PointsExpiringItem(fecha_caducidad=str(fecha_caducidad), puntos=saldo)
             )
 
+        ids = list(por_cliente)
+        clientes: dict[int, Client] = {}
+        for i in range(0, len(ids), EXPIRE_BATCH_SIZE):
+            for cli in session.exec(select(Client).where(Client.id.in_(ids[i:i + EXPIRE_BATCH_SIZE]))):
+                clientes[cli.id] = cli
+
+    # un correo por cliente
+    return [
+        render_points_expiring_email(
+            to_email=cli.email,
+            cliente_nombre=f"{cli.nombre} {cli.apellido}",
+            items=por_cliente[cid],
+        )
+        for cid, cli in clientes.items()
+        if cli.email
+    ]
+
+#Avisa el vencimiento de puntos mediante mails
+async def _job_points_expiring():
+    """Busca bolsas que vencen en los próximos N días y envía emails agrupados por cliente."""
+    today = date.today()
+    limit = today + timedelta(days=ALERT_DAYS_BEFORE)
+
+    # la consulta es sync: se hace fuera del event loop
+    emails = await asyncio.to_thread(_expiring_emails, today, limit)
+    if not emails:
+        return
+
+    errores = await send_bulk(emails)
+    fallidos = sum(1 for e in errores if e)
+    print(f"[CRON] Avisos de vencimiento enviados: {len(errores) - fallidos}, fallidos: {fallidos}")
+
+# Vence un bloque de bolsas con un UPDATE; devuelve (bolsas, puntos) vencidos
+def _expire_batch(session: Session, today: date) -> tuple[int, int]:
+    rows = session.exec(
+        select(PointsBag.id, PointsBag.cliente_id, PointsBag.saldo_puntos)
+        .where(
+            PointsBag.fecha_caducidad < today,
+            PointsBag.saldo_puntos > 0
+        )
+        .order_by(PointsBag.id)
+        .limit(EXPIRE_BATCH_SIZE)
+    ).all()
+    if not rows:
+        return 0, 0
+
+    # el saldo perdido queda registrado en la bolsa para el reporte de vencidos
+    session.execute(
+        update(PointsBag)
+        .where(PointsBag.id.in_([r[0] for r in rows]))
+        .where(PointsBag.saldo_puntos > 0)
+        .values(
+            puntos_vencidos=PointsBag.puntos_vencidos + PointsBag.saldo_puntos,
+            saldo_puntos=0,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    refresh_client_balances(session, {r[1] for r in rows})
+    session.commit()
+    return len(rows), sum(r[2] for r in rows)
+
 #Explira Bolsas Vencidas
-async def _job_expire_points():
-    """Marca como vencidas las bolsas cuya fecha ya pasó."""
+def _job_expire_points():
+    """
+    Marca como vencidas las bolsas cuya fecha ya pasó, en bloques de EXPIRE_BATCH_SIZE con
+    un commit por bloque. Es sync a propósito: el AsyncIOScheduler lo ejecuta en el
+    executor de hilos y no bloquea el event loop de la API.
+    """
     today = date.today()
+    limit = today + timedelta(days=ALERT_DAYS_BEFORE)
+    total_bolsas = total_puntos = 0
 
     with Session(engine) as session:
-        bolsas_vencidas = session.exec(
-            select(PointsBag)
+        while True:
+            bolsas, puntos = _expire_batch(session, today)
+            total_bolsas += bolsas
+            total_puntos += puntos
+            if bolsas < EXPIRE_BATCH_SIZE:
+                break
+
+        # saldos de clientes con bolsas que entran en la ventana de aviso
+        por_vencer = session.exec(
+            select(PointsBag.cliente_id)
             .where(
-                PointsBag.fecha_caducidad < today,
-                PointsBag.saldo_puntos > 0
+                PointsBag.saldo_puntos > 0,
+                PointsBag.fecha_caducidad >= today,
+                PointsBag.fecha_caducidad <= limit,
             )
+            .distinct()
         ).all()
+        for i in range(0, len(por_vencer), EXPIRE_BATCH_SIZE):
+            refresh_client_balances(session, por_vencer[i:i + EXPIRE_BATCH_SIZE])
+            session.commit()
 
-        for b in bolsas_vencidas:
-            b.saldo_puntos = 0     # puntos ya no disponibles
-            session.add(b)
+    print(f"[CRON] Bolsas vencidas actualizadas: {total_bolsas} ({total_puntos} puntos)")
+    return {"bolsas": total_bolsas, "puntos": total_puntos}
 
-        session.commit()
 
-        print(f"[CRON] Bolsas vencidas actualizadas: {len(bolsas_vencidas)}")
+# Despacha la bandeja de salida de correos
+async def _job_dispatch_outbox():
+    enviados, fallidos = await dispatch_outbox()
+    if enviados or fallidos:
+        print(f"[CRON] Correos enviados: {enviados}, fallidos: {fallidos}")
+
+
+def _job_purge_idempotency_keys():
+    with Session(engine) as session:
+        borradas = purge_expired_keys(session)
+        session.commit()
+    if borradas:
+        print(f"[CRON] Claves de idempotencia vencidas eliminadas: {borradas}")
 
 
 def start_scheduler(app):
@@ -103,6 +178,22 @@ def start_scheduler(app):
         id="expire_points_interval",
         replace_existing=True
     )
+    # despachador de la bandeja de salida de correos
+    scheduler.add_job(
+        _job_dispatch_outbox,
+        "interval",
+        seconds=OUTBOX_INTERVAL_SECONDS,
+        id="email_outbox_dispatch",
+        replace_existing=True,
+    )
+    # limpieza de claves de idempotencia vencidas
+    scheduler.add_job(
+        _job_purge_idempotency_keys,
+        "interval",
+        hours=1,
+        id="idempotency_keys_purge",
+        replace_existing=True,
+    )
     scheduler.start()
     app.state.scheduler = scheduler
 
@@ -1,4 +1,11 @@
-from sqlmodel import SQLModel, create_engine, Session
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app import models
 import os
 from dotenv import load_dotenv
@@ -8,16 +15,106 @@ load_dotenv()
 # Toma la URL de la base de datos desde el .env
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///./cafeteria.db")
 
-connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}      # SQLite, por seguridad, solo permite un hilo de acceso por conexión.
+IS_SQLITE = DB_URL.startswith("sqlite")
 
-engine = create_engine(DB_URL, echo=False, connect_args=connect_args)
+connect_args = {"check_same_thread": False} if IS_SQLITE else {}      # SQLite, por seguridad, solo permite un hilo de acceso por conexión.
+
+# Perfil de SQLite: WAL permite lectores concurrentes con un escritor y busy_timeout
+# hace esperar al escritor en lugar de fallar con "database is locked".
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Pool de conexiones para bases de servidor (PostgreSQL, MySQL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+pool_args = {} if IS_SQLITE else {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": True,
+}
+
+# Se aplica a cada conexión nueva del pool
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")   # negativo = KiB
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+engine = create_engine(DB_URL, echo=False, connect_args=connect_args, **pool_args)
 
 engine = engine  # Exporta el engine para otros módulos
-# Función para crear las tablas
+
+# Driver async por motor: los que ya son async se respetan, el resto se reemplaza
+ASYNC_DRIVERS = {
+    "sqlite": ("aiosqlite", {"aiosqlite"}),
+    "postgresql": ("asyncpg", {"asyncpg", "psycopg"}),
+    "mysql": ("aiomysql", {"aiomysql", "asyncmy"}),
+}
+
+# Driver async equivalente a la URL sync (aiosqlite en local, asyncpg en PostgreSQL).
+# Acepta URLs con driver (postgresql+psycopg2://...) y el alias postgres://
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend, _, sync_driver = parsed.drivername.partition("+")
+    backend = {"postgres": "postgresql", "mariadb": "mysql"}.get(backend, backend)
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(
+            f"No hay driver async conocido para '{parsed.drivername}'; "
+            "defina ASYNC_DATABASE_URL con la URL async de la base."
+        )
+    driver, async_drivers = ASYNC_DRIVERS[backend]
+    if sync_driver in async_drivers:
+        driver = sync_driver
+    return parsed.set(drivername=f"{backend}+{driver}").render_as_string(hide_password=False)
+
+ASYNC_DB_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DB_URL)
+
+async_engine = create_async_engine(ASYNC_DB_URL, echo=False, connect_args=connect_args, **pool_args)
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+# Arranque de los workers: solo verifica que la base esté en la última revisión.
+# El esquema se crea y actualiza aparte, con python -m app.migrate
 def init_db():
-    from . import models  # asegura que las clases estén cargadas
-    SQLModel.metadata.create_all(engine)
+    from .migrate import check_revision
+    check_revision(engine)
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+# SQLite admite un solo escritor: los que esperan el lock sondean con pausas crecientes
+# (busy_timeout) y bajo carga algunos esperan segundos. Las secciones de escritura de los
+# endpoints async se encolan en orden con un lock del proceso; en bases de servidor no hace nada.
+_sqlite_write_lock: Optional[asyncio.Lock] = None
+
+
+@asynccontextmanager
+async def write_lock():
+    global _sqlite_write_lock
+    if not IS_SQLITE:
+        yield
+        return
+    if _sqlite_write_lock is None:
+        _sqlite_write_lock = asyncio.Lock()
+    async with _sqlite_write_lock:
+        yield
+
+# Sesión para endpoints async: no bloquea el event loop mientras espera a la base.
+# expire_on_commit=False para poder devolver los objetos sin recargarlos tras el commit.
+async def get_async_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
@@ -8,6 +8,8 @@ from app.routers import redeem
 
 from .routers import surveys
 from app.routers import integration
+from app.routers import api_keys
+from app.routers import export
 
 
 app = FastAPI(title="Galletita Cafetería")
@@ -35,3 +37,5 @@ app.include_router(products.router)
 app.include_router(redeem.router)
 app.include_router(surveys.router)
 app.include_router(integration.router)
+app.include_router(api_keys.router)
+app.include_router(export.router)
@@ -0,0 +1,240 @@
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import Index, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import Session, SQLModel
+
+from . import models
+from .models import SchemaVersion
+from .core.client_search import FTS_TABLE, TRGM_INDEX
+from .core.balances import rebuild_balances
+from .core.rollups import rebuild_rollups
+
+# ------------------------------------------------------
+# Utilidades idempotentes para las revisiones
+# ------------------------------------------------------
+
+def _add_column(conn: Connection, tabla: str, columna: str, ddl: str) -> None:
+    if columna not in {c["name"] for c in inspect(conn).get_columns(tabla)}:
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {ddl}"))
+
+
+def _create_tables(conn: Connection, *tablas) -> None:
+    SQLModel.metadata.create_all(conn, tables=[t.__table__ for t in tablas])
+
+
+# Índices existentes de una tabla: nombre -> único
+def _indices_existentes(conn: Connection, tabla: str) -> Dict[str, bool]:
+    if conn.dialect.name == "sqlite":
+        # el inspector de SQLite omite los índices por expresión (p. ej. lower(email))
+        rows = conn.execute(
+            text("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND sql IS NOT NULL"),
+            {"t": tabla},
+        ).all()
+        return {name: sql.upper().startswith("CREATE UNIQUE") for name, sql in rows}
+    return {i["name"]: bool(i["unique"]) for i in inspect(conn).get_indexes(tabla)}
+
+
+# Valores repetidos que impiden crear un índice único (hasta 10 ejemplos)
+def _duplicados(conn: Connection, index: Index) -> List[tuple]:
+    exprs = list(index.expressions)
+    stmt = (
+        select(*exprs, func.count().label("n"))
+        .select_from(index.table)
+        .group_by(*exprs)
+        .having(func.count() > 1)
+        .limit(10)
+    )
+    return [tuple(r) for r in conn.execute(stmt).all()]
+
+
+def _create_indexes(conn: Connection, *tablas) -> None:
+    """
+    Crea los índices declarados en los modelos indicados que falten en la base; si uno
+    pasó de no único a único se recrea. Con datos duplicados la revisión falla y se
+    informan los valores para corregirlos antes de volver a ejecutarla.
+    """
+    for modelo in tablas:
+        table = modelo.__table__
+        existentes = _indices_existentes(conn, table.name)
+        for index in table.indexes:
+            if existentes.get(index.name) == bool(index.unique):
+                continue
+            if index.unique:
+                repetidos = _duplicados(conn, index)
+                if repetidos:
+                    raise RuntimeError(f"No se puede crear {index.name}: valores duplicados {repetidos}")
+            if index.name in existentes:
+                conn.execute(text(f"DROP INDEX {index.name}"))
+            index.create(conn)
+
+
+# ------------------------------------------------------
+# Revisiones (se aplican en orden, cada una en su transacción).
+# Deben ser idempotentes: en una base nueva se aplican sobre el esquema ya creado.
+# ------------------------------------------------------
+
+def _rev1(conn: Connection) -> None:
+    _create_tables(
+        conn,
+        models.ClientBalance,
+        models.CacheVersion,
+        models.EmailOutbox,
+        models.IdempotencyKey,
+        models.ApiKey,
+    )
+
+
+def _rev2(conn: Connection) -> None:
+    _add_column(conn, "pointsbag", "puntos_vencidos", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _rev3(conn: Connection) -> None:
+    _create_indexes(
+        conn,
+        models.Client,
+        models.PointsBag,
+        models.PointsUseHeader,
+        models.PointsUseDetail,
+        models.Survey,
+    )
+
+
+def _rev4(conn: Connection) -> None:
+    if conn.dialect.name == "sqlite":
+        # índice FTS5 sobre nombre y apellido (contenido externo: la tabla client)
+        conn.execute(text(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                nombre, apellido,
+                content='client', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """))
+        # triggers que lo mantienen sincronizado en altas, cambios y bajas
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON client BEGIN
+                INSERT INTO {FTS_TABLE}(rowid, nombre, apellido) VALUES (new.id, new.nombre, new.apellido);
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON client BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nombre, apellido)
+                VALUES ('delete', old.id, old.nombre, old.apellido);
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF nombre, apellido ON client BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nombre, apellido)
+                VALUES ('delete', old.id, old.nombre, old.apellido);
+                INSERT INTO {FTS_TABLE}(rowid, nombre, apellido) VALUES (new.id, new.nombre, new.apellido);
+            END
+        """))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    elif conn.dialect.name == "postgresql":
+        # índice trigram sobre el nombre completo (lo mantiene la propia base)
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS {TRGM_INDEX} ON client
+            USING gin ((lower(nombre || ' ' || apellido)) gin_trgm_ops)
+        """))
+
+
+def _rev5(conn: Connection) -> None:
+    _create_indexes(conn, models.Survey)
+
+
+def _rev6(conn: Connection) -> None:
+    _create_tables(conn, models.DailyStats, models.MonthlyStats)
+    with Session(bind=conn) as session:
+        rebuild_rollups(session)
+        session.flush()
+
+
+# Carga de clientbalance para los clientes existentes: la revisión 1 solo crea la tabla
+# y las lecturas (listados, segmentos, exportación) la unen con outer join
+def _rev7(conn: Connection) -> None:
+    with Session(bind=conn) as session:
+        rebuild_balances(session)
+        session.flush()
+
+
+def _rev8(conn: Connection) -> None:
+    _add_column(conn, "idempotencykey", "reclamada", "TIMESTAMP")
+
+
+def _rev9(conn: Connection) -> None:
+    _create_indexes(conn, models.Client)
+
+
+REVISIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Saldos materializados, caché, bandeja de salida, idempotencia y llaves de API", _rev1),
+    (2, "Puntos vencidos por bolsa", _rev2),
+    (3, "Índices de búsqueda, listados y claves foráneas; documento, email y código de referido únicos", _rev3),
+    (4, "Búsqueda de clientes por nombre (FTS5 en SQLite, pg_trgm en PostgreSQL)", _rev4),
+    (5, "Índice de encuestas por fecha y cliente", _rev5),
+    (6, "Acumulados diarios y mensuales del dashboard (con carga del historial)", _rev6),
+    (7, "Carga de saldos materializados de los clientes existentes", _rev7),
+    (8, "Reserva con vencimiento para las claves de idempotencia en proceso", _rev8),
+    (9, "Índice de nacionalidad sin distinguir mayúsculas", _rev9),
+]
+
+HEAD = REVISIONS[-1][0]
+
+
+def current_revision(conn: Connection) -> int:
+    if not inspect(conn).has_table(SchemaVersion.__tablename__):
+        return 0
+    return conn.execute(select(func.max(SchemaVersion.revision))).scalar() or 0
+
+
+def _stamp(conn: Connection, revision: int, descripcion: str) -> None:
+    conn.execute(insert(SchemaVersion).values(
+        revision=revision, descripcion=descripcion, aplicada=datetime.utcnow()
+    ))
+
+
+def upgrade(engine: Engine) -> List[int]:
+    """
+    Lleva la base a la última revisión y devuelve las revisiones aplicadas.
+    Una base vacía se crea con el esquema actual de los modelos y luego recibe todas las
+    revisiones (solo agregan lo que los modelos no describen, como índices FTS); una base
+    existente (incluidas las creadas con create_all, sin historial) recibe las pendientes.
+    """
+    with engine.begin() as conn:
+        if not inspect(conn).get_table_names():
+            SQLModel.metadata.create_all(conn)
+        else:
+            _create_tables(conn, SchemaVersion)
+        actual = current_revision(conn)
+
+    aplicadas = []
+    for revision, descripcion, aplicar in REVISIONS:
+        if revision <= actual:
+            continue
+        with engine.begin() as conn:
+            aplicar(conn)
+            _stamp(conn, revision, descripcion)
+        aplicadas.append(revision)
+    return aplicadas
+
+
+def check_revision(engine: Engine) -> None:
+    """Comprobación de arranque de los workers: no modifica el esquema."""
+    with engine.connect() as conn:
+        actual = current_revision(conn)
+    if actual < HEAD:
+        raise RuntimeError(
+            f"La base está en la revisión {actual} y la aplicación requiere la {HEAD}. "
+            "Ejecutar: python -m app.migrate"
+        )
+
+
+# Uso: python -m app.migrate
+if __name__ == "__main__":
+    from .db import engine
+
+    aplicadas = upgrade(engine)
+    if aplicadas:
+        print(f"Revisiones aplicadas: {aplicadas}")
+    print(f"Esquema en la revisión {HEAD}")
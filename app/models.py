@@ -2,6 +2,7 @@ from datetime import date, datetime
 from typing import List, Optional
 from uuid import uuid4
 from sqlmodel import SQLModel, Field, Relationship, UniqueConstraint
+from sqlalchemy import Index, func
 from pydantic import BaseModel
 from typing import Optional
 from sqlmodel import SQLModel, Field
@@ -10,23 +11,31 @@ class Client(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     nombre: str
     apellido: str
-    nro_documento: str
+    nro_documento: str = Field(index=True, unique=True)
     tipo_documento: str
-    nacionalidad: str
+    nacionalidad: str = Field(index=True)
     email: str
-    telefono: str
-    fecha_nacimiento: date
+    telefono: str = Field(index=True)
+    fecha_nacimiento: date = Field(index=True)
 
     # Sistema de referidos
     referral_code: str = Field(
         default_factory=lambda: uuid4().hex[:8],  # código corto. Ej: a1b2c3d4
-        index=True
+        index=True,
+        unique=True
     )
     referred_by_id: Optional[int] = Field(
         default=None,
-        foreign_key="client.id"
+        foreign_key="client.id",
+        index=True
     )
 
+
+# email único sin distinguir mayúsculas (las búsquedas usan lower(email))
+Index("ux_client_email_lower", func.lower(Client.email), unique=True)
+# filtro de segmentación por nacionalidad sin distinguir mayúsculas
+Index("ix_client_nacionalidad_lower", func.lower(Client.nacionalidad))
+
 class Rule(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     limite_inferior: Optional[int] = None
@@ -34,6 +43,37 @@ class Rule(SQLModel, table=True):
     equivalencia_monto: int                # Cuántos puntos equivale x guaranies
 
 
+# Contador de versión de las cachés en memoria (compartido entre workers)
+class CacheVersion(SQLModel, table=True):
+    nombre: str = Field(primary_key=True)
+    version: int = 0
+
+# Acumulados del dashboard por día y por mes (los actualizan las operaciones de escritura)
+class DailyStats(SQLModel, table=True):
+    fecha: date = Field(primary_key=True)
+    puntos_asignados: int = 0
+    puntos_canjeados: int = 0
+    canjes: int = 0
+    encuestas: int = 0
+    suma_puntuacion: int = 0
+
+class MonthlyStats(SQLModel, table=True):
+    mes: str = Field(primary_key=True)       # "YYYY-MM"
+    puntos_asignados: int = 0
+    puntos_canjeados: int = 0
+    canjes: int = 0
+    encuestas: int = 0
+    suma_puntuacion: int = 0
+
+# Revisiones del esquema aplicadas por python -m app.migrate
+class SchemaVersion(SQLModel, table=True):
+    __tablename__ = "schema_version"
+
+    revision: int = Field(primary_key=True)
+    descripcion: str
+    aplicada: datetime = Field(default_factory=datetime.utcnow)
+
+
 class ExpirationParam(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     fecha_inicio_validez: Optional[date] = None
@@ -48,6 +88,13 @@ class PointConcept(SQLModel, table=True):
 
 
 class PointsBag(SQLModel, table=True):
+    __table_args__ = (
+        # consumo FIFO y saldo por cliente (bolsas vigentes con saldo, por vencimiento)
+        Index("ix_pointsbag_cliente_caducidad_saldo", "cliente_id", "fecha_caducidad", "saldo_puntos"),
+        # vencimiento de bolsas y avisos (todas las bolsas que vencen en un rango)
+        Index("ix_pointsbag_caducidad_saldo", "fecha_caducidad", "saldo_puntos"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     cliente_id: int = Field(foreign_key="client.id")
     fecha_asignacion: date
@@ -56,12 +103,19 @@ class PointsBag(SQLModel, table=True):
     puntos_utilizados: int = 0
     saldo_puntos: int
     monto_operacion: int
+    puntos_vencidos: int = 0         # saldo que se perdió al vencer la bolsa
 
     # Relaciones
     usos_detalle: List["PointsUseDetail"] = Relationship(back_populates="bolsa")
 
 
 class PointsUseHeader(SQLModel, table=True):
+    # claves de orden de los listados de canjes (general y por cliente)
+    __table_args__ = (
+        Index("ix_pointsuseheader_fecha_id", "fecha", "id"),
+        Index("ix_pointsuseheader_cliente_fecha_id", "cliente_id", "fecha", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     cliente_id: int = Field(foreign_key="client.id")
     concepto_id: int = Field(foreign_key="pointconcept.id")
@@ -74,8 +128,8 @@ class PointsUseHeader(SQLModel, table=True):
 
 class PointsUseDetail(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    cabecera_id: int = Field(foreign_key="pointsuseheader.id")
-    bolsa_id: int = Field(foreign_key="pointsbag.id")
+    cabecera_id: int = Field(foreign_key="pointsuseheader.id", index=True)
+    bolsa_id: int = Field(foreign_key="pointsbag.id", index=True)
     puntaje_utilizado: int
 
     # Relaciones inversas
@@ -93,6 +147,15 @@ class LoyaltyLevel(SQLModel, table=True):
     min_points: int = Field(ge=0)
     priority: int = 0
     benefits: Optional[str] = None
+
+# Saldo materializado por cliente (modelo de lectura)
+class ClientBalance(SQLModel, table=True):
+    cliente_id: int = Field(foreign_key="client.id", primary_key=True)
+    saldo_puntos: int = Field(default=0, index=True)   # suma de bolsas vigentes
+    puntos_por_vencer: int = 0     # saldo que vence dentro de ALERT_DAYS_BEFORE
+    level_id: Optional[int] = Field(default=None, foreign_key="loyaltylevel.id", index=True)
+    actualizado: datetime = Field(default_factory=datetime.utcnow)
+
 class Product(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
@@ -100,9 +163,47 @@ class Product(SQLModel, table=True):
     description: Optional[str] = None
     is_active: bool = True
 
+# Bandeja de salida de correos: se escribe en la misma transacción que la operación
+class EmailOutbox(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    destinatario: str
+    asunto: str
+    cuerpo: str
+    dedup_key: Optional[str] = Field(default=None, unique=True)   # evita encolar dos veces el mismo aviso
+    estado: str = Field(default="pendiente", index=True)          # pendiente | enviado | fallido
+    intentos: int = 0
+    proximo_intento: datetime = Field(default_factory=datetime.utcnow, index=True)
+    lote: Optional[str] = Field(default=None, index=True)         # reserva del despachador que lo tomó
+    ultimo_error: Optional[str] = None
+    creado: datetime = Field(default_factory=datetime.utcnow)
+    enviado: Optional[datetime] = None
+
+# Llaves de la API de integración (solo se guarda el hash)
+class ApiKey(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    nombre: str
+    key_hash: str = Field(unique=True)    # sha256 de la llave
+    prefijo: str                          # primeros caracteres, para identificarla
+    rate_per_second: float = 10.0         # reposición del token bucket
+    burst: int = 20                       # capacidad del token bucket
+    activo: bool = True
+    creado: datetime = Field(default_factory=datetime.utcnow)
+
+# Respuestas guardadas por Idempotency-Key (integración)
+class IdempotencyKey(SQLModel, table=True):
+    clave: str = Field(primary_key=True)      # sha256 de ámbito + Idempotency-Key
+    request_hash: str
+    estado: str = "en_proceso"                # en_proceso | completado
+    respuesta: Optional[str] = None           # JSON de la respuesta original
+    expira: datetime = Field(index=True)
+    reclamada: Optional[datetime] = None      # inicio de la reserva en proceso (lease)
+
 class Survey(SQLModel, table=True):
+    # filtro por rango de fechas y orden del listado (fecha, cliente_id, id)
+    __table_args__ = (Index("ix_survey_fecha_cliente", "fecha", "cliente_id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    cliente_id: int = Field(foreign_key="client.id")
+    cliente_id: int = Field(foreign_key="client.id", index=True)
     fecha: datetime = Field(default_factory=datetime.utcnow)
     puntuacion: int                    # Rango del 1 a 5
     comentario: Optional[str] = None   # opcional
@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from typing import List
+from sqlmodel import Session, select
+from ..db import get_session
+from ..models import ApiKey
+from ..schemas import ApiKeyCreate, ApiKeyCreated, ApiKeyRead, ApiKeyUpdate, ApiKeyUsage
+from ..core.cache import bump_cache_version
+from ..core.api_keys import (
+    ADMIN_API_KEY, API_KEYS_CACHE, api_key_index, generate_api_key, hash_api_key, is_admin_key,
+    usage_snapshot,
+)
+
+
+# Las llaves de integración solo se gestionan con el secreto de administración (ADMIN_API_KEY)
+def verify_admin_key(
+    x_admin_key: str = Header(..., description="Secreto de administración de llaves"),
+):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=503, detail="Gestión de llaves deshabilitada: configure ADMIN_API_KEY")
+    if not is_admin_key(x_admin_key):
+        raise HTTPException(status_code=401, detail="Llave de administración inválida")
+
+
+router = APIRouter(prefix="/api-keys", tags=["Llaves de API"], dependencies=[Depends(verify_admin_key)])
+
+
+def _validate_limits(rate_per_second, burst):
+    if rate_per_second is not None and rate_per_second <= 0:
+        raise HTTPException(400, "rate_per_second debe ser mayor a 0.")
+    if burst is not None and burst < 1:
+        raise HTTPException(400, "burst debe ser al menos 1.")
+
+
+# Crear una llave: el valor en claro solo se devuelve en esta respuesta
+@router.post("", response_model=ApiKeyCreated, status_code=status.HTTP_201_CREATED)
+def create_api_key(payload: ApiKeyCreate, session: Session = Depends(get_session)):
+    _validate_limits(payload.rate_per_second, payload.burst)
+    raw = generate_api_key()
+    key = ApiKey(
+        nombre=payload.nombre,
+        key_hash=hash_api_key(raw),
+        prefijo=raw[:6],
+        rate_per_second=payload.rate_per_second,
+        burst=payload.burst,
+    )
+    session.add(key)
+    bump_cache_version(session, API_KEYS_CACHE)
+    session.commit()
+    api_key_index.invalidate()
+    session.refresh(key)
+    return ApiKeyCreated(**ApiKeyRead.from_orm(key).dict(), api_key=raw)
+
+# Listar llaves
+@router.get("", response_model=List[ApiKeyRead])
+def list_api_keys(session: Session = Depends(get_session)):
+    return session.exec(select(ApiKey).order_by(ApiKey.id)).all()
+
+# Uso por llave desde el arranque de este worker
+@router.get("/usage", response_model=List[ApiKeyUsage])
+def api_keys_usage(session: Session = Depends(get_session)):
+    nombres = {k.id: k.nombre for k in session.exec(select(ApiKey)).all()}
+    nombres[0] = "env"
+    return [
+        ApiKeyUsage(
+            id=kid,
+            nombre=nombres.get(kid, "eliminada"),
+            permitidas=permitidas,
+            rechazadas=rechazadas,
+            ultimo_uso=ultimo_uso,
+        )
+        for kid, (permitidas, rechazadas, ultimo_uso) in sorted(usage_snapshot().items())
+    ]
+
+# Actualizar límites, nombre o estado
+@router.patch("/{key_id}", response_model=ApiKeyRead)
+def update_api_key(key_id: int, payload: ApiKeyUpdate, session: Session = Depends(get_session)):
+    key = session.get(ApiKey, key_id)
+    if not key:
+        raise HTTPException(404, "Llave no encontrada")
+    data = payload.dict(exclude_unset=True)
+    _validate_limits(data.get("rate_per_second"), data.get("burst"))
+    for k, v in data.items():
+        setattr(key, k, v)
+    session.add(key)
+    bump_cache_version(session, API_KEYS_CACHE)
+    session.commit()
+    api_key_index.invalidate()
+    session.refresh(key)
+    return key
+
+# Eliminar una llave
+@router.delete("/{key_id}")
+def delete_api_key(key_id: int, session: Session = Depends(get_session)):
+    key = session.get(ApiKey, key_id)
+    if not key:
+        raise HTTPException(404, "Llave no encontrada")
+    session.delete(key)
+    bump_cache_version(session, API_KEYS_CACHE)
+    session.commit()
+    api_key_index.invalidate()
+    return {"ok": True}
@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import tempfile
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_, tuple_
 from sqlalchemy.exc import IntegrityError
-from datetime import date, timedelta
+from datetime import date
 from typing import List, Optional
-from sqlmodel import Session, select
+from sqlmodel import Session, select, func
 from ..db import get_session
-from ..models import Client, PointsBag, LoyaltyLevel
-from ..schemas import ClientCreate, ClientUpdate, ClientWithPoints
+from ..models import Client, ClientBalance, PointsBag, LoyaltyLevel
+from ..schemas import ClientCreate, ClientImportResult, ClientUpdate, ClientWithPoints
+from ..core.balances import get_client_balance, refresh_client_balances
+from ..core.level_index import get_level
+from ..core.referrals import referral_bag_rows
+from ..core.client_import import import_clients
+from ..core.client_search import client_matches
+from ..core.rollups import record_activity
+from ..core.pagination import DEFAULT_LIMIT, MAX_LIMIT, decode_cursor, encode_cursor, set_page_headers
 
 router = APIRouter(prefix="/clients", tags=["Clientes"])
 
@@ -32,18 +42,10 @@ PROMOS_BY_POINTS = [
 
 # Para devolver listado de clientes y sus puntos totales y no repetir código
 def _client_with_points(c: Client, session: Session) -> ClientWithPoints:
-    # Obtener bolsas
-    bolsas = session.exec(
-        select(PointsBag).where(PointsBag.cliente_id == c.id)
-    ).all()
-    total = sum(b.saldo_puntos for b in bolsas) if bolsas else 0
-
-    # Obtener su nivel actual
-    level = session.exec(
-        select(LoyaltyLevel)
-        .where(LoyaltyLevel.min_points <= total)
-        .order_by(LoyaltyLevel.min_points.desc())
-    ).first()
+    # Saldo materializado y nivel actual (lecturas por clave primaria)
+    bal = get_client_balance(session, c.id)
+    total = bal.saldo_puntos
+    level = get_level(session, bal.level_id)
 
     level_id = level.id if level else None
     level_name = level.name if level else None
@@ -65,8 +67,22 @@ def _client_with_points(c: Client, session: Session) -> ClientWithPoints:
         level_name=level_name,
     )
 
-BONUS_REFERENTE = 20  # Puntos para quien refiere
-BONUS_REFERIDO = 10   # Puntos para el nuevo cliente
+# Clientes con su saldo materializado y nivel en una sola consulta
+def _clients_with_points_stmt():
+    return (
+        select(Client, ClientBalance.saldo_puntos, LoyaltyLevel.id, LoyaltyLevel.name)
+        .outerjoin(ClientBalance, ClientBalance.cliente_id == Client.id)
+        .outerjoin(LoyaltyLevel, LoyaltyLevel.id == ClientBalance.level_id)
+    )
+
+def _row_with_points(row) -> ClientWithPoints:
+    c, saldo, level_id, level_name = row
+    return ClientWithPoints(
+        **c.dict(),
+        puntos_totales=saldo or 0,
+        level_id=level_id,
+        level_name=level_name,
+    )
 
 @router.post("", response_model=Client, status_code=status.HTTP_201_CREATED)
 def create_client(payload: ClientCreate, session: Session = Depends(get_session)):
@@ -75,6 +91,7 @@ def create_client(payload: ClientCreate, session: Session = Depends(get_session)
 
     c = Client(**data)
     session.add(c)
+    afectados = []
 
     try:
         # Para que c.id exista antes de crear la bolsa del referido
@@ -96,32 +113,16 @@ def create_client(payload: ClientCreate, session: Session = Depends(get_session)
             # Guardar quién lo refirió
             c.referred_by_id = referidor.id
 
-            hoy = date.today()
-            fecha_cad = hoy + timedelta(days=365)  # 1 año de vigencia
-
-            # Bolsa de puntos para el referidor
-            bolsa_referente = PointsBag(
-                cliente_id=referidor.id,
-                fecha_asignacion=hoy,
-                fecha_caducidad=fecha_cad,
-                puntos_asignados=BONUS_REFERENTE,
-                puntos_utilizados=0,
-                saldo_puntos=BONUS_REFERENTE,
-                monto_operacion=0,
-            )
-            session.add(bolsa_referente)
-
-            # Bolsa de puntos para el nuevo cliente (referido)
-            bolsa_referido = PointsBag(
-                cliente_id=c.id,
-                fecha_asignacion=hoy,
-                fecha_caducidad=fecha_cad,
-                puntos_asignados=BONUS_REFERIDO,
-                puntos_utilizados=0,
-                saldo_puntos=BONUS_REFERIDO,
-                monto_operacion=0,
-            )
-            session.add(bolsa_referido)
+            # Bolsas de puntos para el referidor y para el nuevo cliente (referido)
+            bonos = referral_bag_rows(referidor.id, c.id, date.today())
+            for row in bonos:
+                session.add(PointsBag(**row))
+            record_activity(session, date.today(), puntos_asignados=sum(b["puntos_asignados"] for b in bonos))
+            afectados.append(referidor.id)
+
+        # Saldo materializado del nuevo cliente (y del referidor si hubo bono)
+        afectados.append(c.id)
+        refresh_client_balances(session, afectados)
 
         session.commit()
     except IntegrityError:
@@ -131,22 +132,101 @@ def create_client(payload: ClientCreate, session: Session = Depends(get_session)
     session.refresh(c)
     return c
 
-# Listar clientes
+# Cuerpo de la importación en memoria hasta este tamaño; más grande, a disco
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+# Importación masiva: el cuerpo es el archivo CSV (con cabecera) o NDJSON, sin multipart
+@router.post("/import", response_model=ClientImportResult)
+async def import_clients_file(
+    request: Request,
+    formato: str = Query("csv", regex="^(ndjson|csv)$", description="csv o ndjson"),
+):
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as file:
+        async for chunk in request.stream():
+            file.write(chunk)
+        file.seek(0)
+        report = await run_in_threadpool(import_clients, file, formato)
+
+    return ClientImportResult(
+        importados=report.importados,
+        total_errores=report.total_errores,
+        errores=report.errores,
+    )
+
+# Página de clientes ordenada por id a partir del cursor
+def _page_clients(
+    session: Session,
+    request: Request,
+    response: Response,
+    filtros: list,
+    limit: int,
+    cursor: Optional[str],
+) -> List[ClientWithPoints]:
+    stmt = _clients_with_points_stmt().where(*filtros)
+    after = decode_cursor(cursor)
+    if after:
+        stmt = stmt.where(Client.id > after[0])
+    rows = session.exec(stmt.order_by(Client.id).limit(limit + 1)).all()
+
+    next_cursor = encode_cursor([rows[limit - 1][0].id]) if len(rows) > limit else None
+    set_page_headers(request, response, next_cursor)
+    return [_row_with_points(r) for r in rows[:limit]]
+
+# Listar clientes (paginado por id; total en X-Total-Count y siguiente página en Link)
 @router.get("", response_model=List[ClientWithPoints])
 def list_clients(
+    request: Request,
+    response: Response,
     q: Optional[str] = Query(None, description="Buscar por nombre/apellido"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
     session: Session = Depends(get_session),
 ):
-    clientes = session.exec(select(Client)).all()
+    filtros = []
     if q:
+        # subcadena en nombre o apellido (la búsqueda por prefijos con ranking es /clients/search)
         ql = q.lower()
-        clientes = [
-            c for c in clientes
-            if ql in c.nombre.lower() or ql in c.apellido.lower()
-        ]
+        filtros.append(or_(
+            func.lower(Client.nombre).contains(ql, autoescape=True),
+            func.lower(Client.apellido).contains(ql, autoescape=True),
+        ))
+
+    response.headers["X-Total-Count"] = str(
+        session.exec(select(func.count(Client.id)).where(*filtros)).one()
+    )
+    return _page_clients(session, request, response, filtros, limit, cursor)
+
+# Búsqueda por nombre/apellido con ranking (mejores coincidencias primero), paginada por cursor
+@router.get("/search", response_model=List[ClientWithPoints])
+def search_clients(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, description="Nombre y/o apellido (o su comienzo)"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
+    session: Session = Depends(get_session),
+):
+    coincidencias = client_matches(session, q).subquery()
+    stmt = (
+        _clients_with_points_stmt()
+        .add_columns(coincidencias.c.rank)
+        .join(coincidencias, coincidencias.c.cliente_id == Client.id)
+    )
+    after = decode_cursor(cursor)
+    if after:
+        if len(after) != 2:
+            raise HTTPException(400, "Cursor inválido.")
+        stmt = stmt.where(tuple_(coincidencias.c.rank, Client.id) > tuple_(*after))
+    rows = session.exec(
+        stmt.order_by(coincidencias.c.rank, Client.id).limit(limit + 1)
+    ).all()
 
-    # Mapear cada cliente a ClientWithPoints
-    return [_client_with_points(c, session) for c in clientes]
+    next_cursor = None
+    if len(rows) > limit:
+        ultima = rows[limit - 1]
+        next_cursor = encode_cursor([ultima[4], ultima[0].id])
+    set_page_headers(request, response, next_cursor)
+    return [_row_with_points(r[:4]) for r in rows[:limit]]
 
 # Búsqueda específica
 @router.get("/find", response_model=List[ClientWithPoints])
@@ -156,101 +236,95 @@ def find_clients(
     telefono: Optional[str] = None,
     session: Session = Depends(get_session),
 ):
-    stmt = select(Client)
+    stmt = _clients_with_points_stmt()
     if nro_documento:
         stmt = stmt.where(Client.nro_documento == nro_documento)
     if email:
-        stmt = stmt.where(Client.email.ilike(email))  # o == si tenés normalizado
+        stmt = stmt.where(func.lower(Client.email) == email.lower())  # usa ux_client_email_lower
     if telefono:
         stmt = stmt.where(Client.telefono == telefono)
 
-    clientes = session.exec(stmt).all()
-    return [_client_with_points(c, session) for c in clientes]
+    return [_row_with_points(r) for r in session.exec(stmt).all()]
+
+# Fecha de hace N años (29/02 pasa a 28/02 en años no bisiestos)
+def _years_ago(hoy: date, years: int) -> date:
+    try:
+        return hoy.replace(year=hoy.year - years)
+    except ValueError:
+        return hoy.replace(year=hoy.year - years, day=28)
+
+# Filtros de segmentación traducidos a predicados SQL
+def _segment_filters(
+    min_age: Optional[int],
+    max_age: Optional[int],
+    nacionalidad: Optional[str],
+    min_points: Optional[int],
+    max_points: Optional[int],
+    level_id: Optional[int],
+) -> list:
+    hoy = date.today()
+    puntos = func.coalesce(ClientBalance.saldo_puntos, 0)
+    filtros = []
+
+    # Edad: cumplió min_age años y todavía no cumplió max_age + 1
+    if min_age is not None:
+        filtros.append(Client.fecha_nacimiento <= _years_ago(hoy, min_age))
+    if max_age is not None:
+        filtros.append(Client.fecha_nacimiento > _years_ago(hoy, max_age + 1))
+
+    # Nacionalidad
+    if nacionalidad:
+        filtros.append(func.lower(Client.nacionalidad) == nacionalidad.lower())
+
+    # Puntos
+    if min_points is not None:
+        filtros.append(puntos >= min_points)
+    if max_points is not None:
+        filtros.append(puntos <= max_points)
+
+    # Nivel fidelización
+    if level_id is not None:
+        filtros.append(ClientBalance.level_id == level_id)
+
+    return filtros
 
 # Segmentación de clientes
 @router.get("/segment", response_model=List[ClientWithPoints])
 def segment_clients(
+    request: Request,
+    response: Response,
     min_age: Optional[int] = None,
     max_age: Optional[int] = None,
     nacionalidad: Optional[str] = None,
     min_points: Optional[int] = None,
     max_points: Optional[int] = None,
     level_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
     session: Session = Depends(get_session),
 ):
-    clientes = session.exec(select(Client)).all()
-    hoy = date.today()
-    resultado = []
-
-    for c in clientes:
-        incluir = True
-
-        # Calcular edad
-        edad = hoy.year - c.fecha_nacimiento.year
-        if (hoy.month, hoy.day) < (c.fecha_nacimiento.month, c.fecha_nacimiento.day):
-            edad -= 1
-
-        # Edad
-        if min_age is not None and edad < min_age:
-            incluir = False
-        if max_age is not None and edad > max_age:
-            incluir = False
-
-        # Nacionalidad
-        if nacionalidad and c.nacionalidad.lower() != nacionalidad.lower():
-            incluir = False
-
-        # Calcular puntos del cliente
-        bolsas = session.exec(
-            select(PointsBag).where(PointsBag.cliente_id == c.id)
-        ).all()
-        puntos = sum(b.saldo_puntos for b in bolsas) if bolsas else 0
-
-        # Puntos
-        if min_points is not None and puntos < min_points:
-            incluir = False
-        if max_points is not None and puntos > max_points:
-            incluir = False
-
-        # Nivel fidelización
-        if level_id is not None:
-            nivel = session.exec(
-                select(LoyaltyLevel)
-                .where(LoyaltyLevel.min_points <= puntos)
-                .order_by(LoyaltyLevel.min_points.desc())
-            ).first()
-
-            if not nivel or nivel.id != level_id:
-                incluir = False
-
-        #  Si pasa los filtros, agregar cliente con puntos
-        if incluir:
-            resultado.append(_client_with_points(c, session))
-
-    return resultado
+    filtros = _segment_filters(min_age, max_age, nacionalidad, min_points, max_points, level_id)
+    return _page_clients(session, request, response, filtros, limit, cursor)
 
 
 @router.get("/promotions")
 def get_promotions(
+    request: Request,
+    response: Response,
     min_age: Optional[int] = None,
     max_age: Optional[int] = None,
     nacionalidad: Optional[str] = None,
     min_points: Optional[int] = None,
     max_points: Optional[int] = None,
     level_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
     session: Session = Depends(get_session)
 ):
 
-    # Obtenemos los clientes segmentados
-    clientes = segment_clients(
-        min_age=min_age,
-        max_age=max_age,
-        nacionalidad=nacionalidad,
-        min_points=min_points,
-        max_points=max_points,
-        level_id=level_id,
-        session=session
-    )
+    # Obtenemos los clientes segmentados (una página)
+    filtros = _segment_filters(min_age, max_age, nacionalidad, min_points, max_points, level_id)
+    clientes = _page_clients(session, request, response, filtros, limit, cursor)
 
     promociones_finales = []
 
@@ -300,7 +374,13 @@ def update_client(client_id: int, payload: ClientUpdate, session: Session = Depe
     if not c: raise HTTPException(404, "Cliente no encontrado")
     if payload.telefono is not None: c.telefono = payload.telefono
     if payload.email is not None: c.email = payload.email
-    session.add(c); session.commit(); session.refresh(c)
+    session.add(c)
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(409, "El email ya pertenece a otro cliente")
+    session.refresh(c)
     return c
 
 # Eliminar cliente
@@ -309,5 +389,8 @@ def delete_client(client_id: int, session: Session = Depends(get_session)):
     c = session.get(Client, client_id)
     if not c:
         raise HTTPException(404, "Cliente no encontrado")
+    bal = session.get(ClientBalance, client_id)
+    if bal:
+        session.delete(bal)
     session.delete(c); session.commit()
     return
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import List, Optional
 from sqlmodel import Session, select
 from ..db import get_session
 from ..models import PointConcept
 from ..schemas import ConceptCreate, ConceptUpdate
+from ..core.pagination import DEFAULT_LIMIT, MAX_LIMIT, keyset_page
 
 router = APIRouter(prefix="/concepts", tags=["Conceptos"])
 
@@ -18,8 +19,14 @@ def create_concept(payload: ConceptCreate, session: Session = Depends(get_sessio
 
 # Listar Concepto
 @router.get("", response_model=List[PointConcept])
-def list_concepts(session: Session = Depends(get_session)):
-    return list(session.exec(select(PointConcept)).all())
+def list_concepts(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
+    session: Session = Depends(get_session),
+):
+    return keyset_page(session, request, response, select(PointConcept), [PointConcept.id], limit, cursor)
 
 # Actualizar un concepto
 @router.put("/{concept_id}", response_model=PointConcept)
@@ -1,13 +1,33 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+from sqlalchemy import and_, case, or_, true, union
 from sqlmodel import Session, select, func
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from app.db import get_session
-from app.models import Client, PointsBag, PointsUseHeader, Survey, LoyaltyLevel
+from app.core.response_cache import dashboard_cache
+from app.models import Client, DailyStats, MonthlyStats, PointsBag, PointsUseHeader, Survey, LoyaltyLevel
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
 
+# Costo estimado de cada punto canjeado (guaraníes), para el ROI
+COSTO_POR_PUNTO = 100  # puedes ajustarlo
+
+# Rango opcional de meses ("YYYY-MM") para las series mensuales
+MES_DESDE = Query(None, regex=r"^\d{4}-\d{2}$", description="Mes inicial (YYYY-MM)")
+MES_HASTA = Query(None, regex=r"^\d{4}-\d{2}$", description="Mes final (YYYY-MM)")
+
+# Serie mensual desde los acumulados (lectura por rango de la clave primaria)
+def _serie_mensual(session: Session, columna, desde: Optional[str], hasta: Optional[str]):
+    stmt = select(MonthlyStats).where(columna > 0).order_by(MonthlyStats.mes)
+    if desde:
+        stmt = stmt.where(MonthlyStats.mes >= desde)
+    if hasta:
+        stmt = stmt.where(MonthlyStats.mes <= hasta)
+    return session.exec(stmt).all()
+
 #Total de Puntos Canjeados
 @router.get("/puntos-canjeados")
+@dashboard_cache.cached("pointsuseheader")
 def puntos_canjeados(session: Session = Depends(get_session)):
     total = session.exec(
         select(func.sum(PointsUseHeader.puntaje_utilizado))
@@ -17,6 +37,7 @@ def puntos_canjeados(session: Session = Depends(get_session)):
 
 #Calculo de retención de clientes, son activos si tienen actividad en ultimos 90 días
 @router.get("/retencion")
+@dashboard_cache.cached("pointsbag", "pointsuseheader", "survey", "client")
 def tasa_retencion(session: Session = Depends(get_session)):
     hoy = datetime.utcnow()
     hace_90_dias = hoy - timedelta(days=90)
@@ -55,6 +76,7 @@ def tasa_retencion(session: Session = Depends(get_session)):
 
 #Retorno de Inversión 
 @router.get("/roi")
+@dashboard_cache.cached("pointsbag", "pointsuseheader")
 def calcular_roi(session: Session = Depends(get_session)):
     monto_total = session.exec(
         select(func.sum(PointsBag.monto_operacion))
@@ -64,8 +86,7 @@ def calcular_roi(session: Session = Depends(get_session)):
         select(func.sum(PointsUseHeader.puntaje_utilizado))
     ).one() or 0
 
-    costo_por_punto = 100  # puedes ajustarlo
-    costo_total_puntos = puntos_canjeados * costo_por_punto
+    costo_total_puntos = puntos_canjeados * COSTO_POR_PUNTO
 
     if costo_total_puntos == 0:
         return {"roi": None, "detalle": "No hubo canjes aún"}
@@ -88,80 +109,105 @@ def calcular_roi(session: Session = Depends(get_session)):
 
 #Puntos Vigentes del sistema
 @router.get("/puntos/vigentes")
+@dashboard_cache.cached("pointsbag")
 def puntos_vigentes(session: Session = Depends(get_session)):
     total = session.exec(
         select(func.sum(PointsBag.saldo_puntos))
-        .where(PointsBag.fecha_caducidad >= datetime.utcnow())
+        .where(PointsBag.fecha_caducidad >= date.today())
     ).one() or 0
     return {"puntos_vigentes": int(total)}
 
 #Total de puntos no utilizados/vencidos
+#(los ya procesados por el job quedan en puntos_vencidos; los pendientes siguen en saldo)
 @router.get("/puntos/vencidos")
+@dashboard_cache.cached("pointsbag")
 def puntos_vencidos(session: Session = Depends(get_session)):
     total = session.exec(
-        select(func.sum(PointsBag.saldo_puntos))
-        .where(PointsBag.fecha_caducidad < datetime.utcnow())
+        select(
+            func.sum(
+                PointsBag.puntos_vencidos
+                + case((PointsBag.fecha_caducidad < date.today(), PointsBag.saldo_puntos), else_=0)
+            )
+        )
     ).one() or 0
     return {"puntos_vencidos": int(total)}
 
 #Puntos asignados por mes(Cuantos puntos son destinados a clientes)
 @router.get("/puntos-asignados-mensual")
-def puntos_asignados_mensual(session: Session = Depends(get_session)):
-    results = session.exec(
-        select(
-            func.strftime('%Y-%m', PointsBag.fecha_asignacion).label("mes"),
-            func.sum(PointsBag.puntos_asignados).label("total_puntos")
-        )
-        .group_by(func.strftime('%Y-%m', PointsBag.fecha_asignacion))
-        .order_by(func.strftime('%Y-%m', PointsBag.fecha_asignacion))
-    ).all()
-
-    return [
-        {
-            "mes": row[0],
-            "puntos_asignados": row[1]
-        } for row in results
-    ]
+@dashboard_cache.cached("monthlystats")
+def puntos_asignados_mensual(
+    desde: Optional[str] = MES_DESDE,
+    hasta: Optional[str] = MES_HASTA,
+    session: Session = Depends(get_session),
+):
+    rows = _serie_mensual(session, MonthlyStats.puntos_asignados, desde, hasta)
+    return [{"mes": r.mes, "puntos_asignados": r.puntos_asignados} for r in rows]
 
 #Puntos canjeados por mes(Cuantos puntos canjean los clientes)
 @router.get("/puntos/canjeados-por-mes")
-def puntos_canjeados_por_mes(session: Session = Depends(get_session)):
-    rows = session.exec(
-        select(
-            func.strftime("%Y-%m", PointsUseHeader.fecha),
-            func.sum(PointsUseHeader.puntaje_utilizado)
-        ).group_by(func.strftime("%Y-%m", PointsUseHeader.fecha))
-    ).all()
-    return [{"mes": r[0], "puntos_canjeados": int(r[1])} for r in rows]
+@dashboard_cache.cached("monthlystats")
+def puntos_canjeados_por_mes(
+    desde: Optional[str] = MES_DESDE,
+    hasta: Optional[str] = MES_HASTA,
+    session: Session = Depends(get_session),
+):
+    rows = _serie_mensual(session, MonthlyStats.puntos_canjeados, desde, hasta)
+    return [{"mes": r.mes, "puntos_canjeados": r.puntos_canjeados} for r in rows]
 
 #Canjes realizados por mes(Cantidad de Compras realizadas)
 @router.get("/canjes/por-mes")
-def canjes_por_mes(session: Session = Depends(get_session)):
-    rows = session.exec(
-        select(
-            func.strftime("%Y-%m", PointsUseHeader.fecha),
-            func.count(PointsUseHeader.id)
-        ).group_by(func.strftime("%Y-%m", PointsUseHeader.fecha))
-    ).all()
-    return [{"mes": r[0], "canjes": r[1]} for r in rows]
+@dashboard_cache.cached("monthlystats")
+def canjes_por_mes(
+    desde: Optional[str] = MES_DESDE,
+    hasta: Optional[str] = MES_HASTA,
+    session: Session = Depends(get_session),
+):
+    rows = _serie_mensual(session, MonthlyStats.canjes, desde, hasta)
+    return [{"mes": r.mes, "canjes": r.canjes} for r in rows]
 
 #Encuestas promedio por mes
 @router.get("/encuestas/promedio-por-mes")
-def encuestas_promedio_por_mes(session: Session = Depends(get_session)):
+@dashboard_cache.cached("monthlystats")
+def encuestas_promedio_por_mes(
+    desde: Optional[str] = MES_DESDE,
+    hasta: Optional[str] = MES_HASTA,
+    session: Session = Depends(get_session),
+):
+    rows = _serie_mensual(session, MonthlyStats.encuestas, desde, hasta)
+    return [
+        {"mes": r.mes, "promedio": round(r.suma_puntuacion / r.encuestas, 2), "cantidad_encuestas": r.encuestas}
+        for r in rows
+    ]
+
+#Actividad diaria (asignaciones, canjes y encuestas) en un rango de fechas
+@router.get("/actividad/diaria")
+@dashboard_cache.cached("dailystats")
+def actividad_diaria(
+    desde: date = Query(..., description="Fecha inicial (inclusive)"),
+    hasta: date = Query(..., description="Fecha final (inclusive)"),
+    session: Session = Depends(get_session),
+):
     rows = session.exec(
-        select(
-            func.strftime("%Y-%m", Survey.fecha),
-            func.avg(Survey.puntuacion),
-            func.count(Survey.id)
-        ).group_by(func.strftime("%Y-%m", Survey.fecha))
+        select(DailyStats)
+        .where(DailyStats.fecha >= desde)
+        .where(DailyStats.fecha <= hasta)
+        .order_by(DailyStats.fecha)
     ).all()
     return [
-        {"mes": r[0], "promedio": round(r[1], 2), "cantidad_encuestas": r[2]}
+        {
+            "fecha": r.fecha,
+            "puntos_asignados": r.puntos_asignados,
+            "puntos_canjeados": r.puntos_canjeados,
+            "canjes": r.canjes,
+            "encuestas": r.encuestas,
+            "promedio_encuestas": round(r.suma_puntuacion / r.encuestas, 2) if r.encuestas else None,
+        }
         for r in rows
     ]
 
 #Distribucion de calificaciones
 @router.get("/encuestas/distribucion")
+@dashboard_cache.cached("survey")
 def distribucion_encuestas(session: Session = Depends(get_session)):
     rows = session.exec(
         select(
@@ -172,36 +218,123 @@ def distribucion_encuestas(session: Session = Depends(get_session)):
     return [{"puntuacion": r[0], "cantidad": r[1]} for r in rows]
 
 #Clientes por nivel de fidelización
+#(una sola consulta: saldo vigente por cliente unido a las bandas [min_points, siguiente min_points))
 @router.get("/clientes/niveles")
+@dashboard_cache.cached("client", "pointsbag", "loyaltylevel")
 def clientes_por_nivel(session: Session = Depends(get_session)):
-    # Obtener niveles
-    levels = session.exec(select(LoyaltyLevel)).all()
-    
-    # Inicializar contador
-    resultado = {lvl.name: 0 for lvl in levels}
-
-    # Obtener todos los clientes
-    clientes = session.exec(select(Client)).all()
-
-    # Para cada cliente determinar su nivel igual que hace _client_with_points
-    for c in clientes:
-        # Calcular puntos totales vigentes
-        bolsas = session.exec(
-            select(PointsBag)
-            .where(PointsBag.cliente_id == c.id)
-            .where(PointsBag.fecha_caducidad >= datetime.utcnow())
-        ).all()
-        total = sum(b.saldo_puntos for b in bolsas)
-
-        # Obtener nivel correspondiente
-        nivel = session.exec(
-            select(LoyaltyLevel)
-            .where(LoyaltyLevel.min_points <= total)
-            .order_by(LoyaltyLevel.min_points.desc())
-        ).first()
-
-        if nivel:
-            resultado[nivel.name] += 1
+    # Puntos vigentes por cliente; los clientes sin bolsas vigentes quedan con 0
+    saldos = (
+        select(Client.id.label("cliente_id"), func.coalesce(func.sum(PointsBag.saldo_puntos), 0).label("puntos"))
+        .select_from(Client)
+        .outerjoin(PointsBag, and_(PointsBag.cliente_id == Client.id, PointsBag.fecha_caducidad >= date.today()))
+        .group_by(Client.id)
+        .subquery()
+    )
+
+    # Banda de cada nivel: hasta el min_points del siguiente (mismo orden que level_index)
+    orden = (LoyaltyLevel.min_points, LoyaltyLevel.id)
+    bandas = select(
+        LoyaltyLevel.id,
+        LoyaltyLevel.name,
+        LoyaltyLevel.min_points,
+        func.lead(LoyaltyLevel.min_points).over(order_by=orden).label("hasta"),
+        func.row_number().over(order_by=orden).label("orden"),
+    ).subquery()
+
+    rows = session.exec(
+        select(bandas.c.name, func.count(saldos.c.cliente_id))
+        .select_from(bandas)
+        .outerjoin(
+            saldos,
+            and_(
+                saldos.c.puntos >= bandas.c.min_points,
+                or_(bandas.c.hasta.is_(None), saldos.c.puntos < bandas.c.hasta),
+            ),
+        )
+        .group_by(bandas.c.id, bandas.c.name, bandas.c.orden)
+        .order_by(bandas.c.orden)
+    ).all()
+
+    resultado = {}
+    for nombre, clientes in rows:
+        resultado[nombre] = resultado.get(nombre, 0) + clientes
 
     # Convertir dict → lista de objetos
     return [{"nivel": k, "clientes": v} for k, v in resultado.items()]
+
+#Resumen del dashboard: indicadores principales en una sola consulta
+#(cada tabla se recorre una vez; las agregaciones de una fila se cruzan entre sí)
+@router.get("/summary")
+@dashboard_cache.cached("pointsbag", "pointsuseheader", "survey", "client")
+def resumen(session: Session = Depends(get_session)):
+    hoy = date.today()
+    hace_90_dias = datetime.utcnow() - timedelta(days=90)
+
+    # PointsBag: monto, asignados, vigentes y vencidos con sumas condicionales
+    bolsas = select(
+        func.coalesce(func.sum(PointsBag.monto_operacion), 0).label("monto_total"),
+        func.coalesce(func.sum(PointsBag.puntos_asignados), 0).label("puntos_asignados"),
+        func.coalesce(
+            func.sum(case((PointsBag.fecha_caducidad >= hoy, PointsBag.saldo_puntos), else_=0)), 0
+        ).label("puntos_vigentes"),
+        func.coalesce(
+            func.sum(
+                PointsBag.puntos_vencidos
+                + case((PointsBag.fecha_caducidad < hoy, PointsBag.saldo_puntos), else_=0)
+            ), 0
+        ).label("puntos_vencidos"),
+    ).subquery()
+
+    canjes = select(
+        func.coalesce(func.sum(PointsUseHeader.puntaje_utilizado), 0).label("puntos_canjeados"),
+        func.count().label("canjes"),
+    ).subquery()
+
+    clientes = select(func.count(Client.id).label("total")).subquery()
+
+    # Clientes con actividad en los últimos 90 días (mismo criterio que /retencion)
+    activos_union = union(
+        select(PointsBag.cliente_id).where(PointsBag.fecha_asignacion >= hace_90_dias),
+        select(PointsUseHeader.cliente_id).where(PointsUseHeader.fecha >= hace_90_dias),
+        select(Survey.cliente_id).where(Survey.fecha >= hace_90_dias),
+    ).subquery()
+    activos = select(func.count().label("total")).select_from(activos_union).subquery()
+
+    r = session.exec(
+        select(
+            bolsas.c.monto_total,
+            bolsas.c.puntos_asignados,
+            bolsas.c.puntos_vigentes,
+            bolsas.c.puntos_vencidos,
+            canjes.c.puntos_canjeados,
+            canjes.c.canjes,
+            clientes.c.total,
+            activos.c.total,
+        ).select_from(bolsas.join(canjes, true()).join(clientes, true()).join(activos, true()))
+    ).one()
+    monto_total, asignados, vigentes, vencidos, canjeados, cant_canjes, total_clientes, total_activos = (
+        int(v) for v in r
+    )
+
+    costo_total_puntos = canjeados * COSTO_POR_PUNTO
+    roi = round((monto_total - costo_total_puntos) / costo_total_puntos, 2) if costo_total_puntos else None
+    tasa = round(total_activos / total_clientes * 100, 2) if total_clientes else 0
+
+    return {
+        "clientes_totales": total_clientes,
+        "clientes_activos_ultimos_90_dias": total_activos,
+        "tasa_retencion": tasa,
+        "puntos_asignados": asignados,
+        "puntos_canjeados": canjeados,
+        "canjes": cant_canjes,
+        "puntos_vigentes": vigentes,
+        "puntos_vencidos": vencidos,
+        "monto_total_generado": monto_total,
+        "costo_programa_puntos": costo_total_puntos,
+        "roi": roi,
+    }
+
+#Aciertos y fallos de la caché de respuestas del dashboard (por proceso)
+@router.get("/cache/stats")
+def cache_stats():
+    return dashboard_cache.stats()
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from datetime import timedelta
 from typing import List, Optional
 from sqlmodel import Session, select, desc
 from ..db import get_session
 from ..models import ExpirationParam
 from ..schemas import ExpirationParamCreate, ExpirationParamRead, ExpirationParamUpdate
+from ..core.pagination import DEFAULT_LIMIT, MAX_LIMIT, keyset_page
 
 router = APIRouter(prefix="/expirations", tags=["Vencimientos"])
 
@@ -31,10 +32,16 @@ def create_expiration(payload: ExpirationParamCreate, session: Session = Depends
     session.refresh(e)
     return e
 
-# Lista todos los vencimientos
+# Lista los vencimientos (paginado por id)
 @router.get("", response_model=List[ExpirationParamRead])
-def list_expirations(session: Session = Depends(get_session)):
-    return list(session.exec(select(ExpirationParam)).all())
+def list_expirations(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
+    session: Session = Depends(get_session),
+):
+    return keyset_page(session, request, response, select(ExpirationParam), [ExpirationParam.id], limit, cursor)
 
 # Obtiene vencimientos actualmente activos o recientes
 @router.get("/current", response_model=Optional[ExpirationParamRead])
@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+from datetime import date
+from typing import Iterator, Optional
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select
+
+from ..db import engine
+from ..models import Client, ClientBalance, PointConcept, PointsBag, PointsUseHeader
+
+router = APIRouter(prefix="/export", tags=["Exportación"])
+
+# Filas leídas de la base por tanda (yield_per usa cursor del servidor donde el motor lo soporta)
+EXPORT_BATCH_SIZE = 1000
+
+_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+FORMATO = Query("ndjson", regex="^(ndjson|csv)$", description="ndjson o csv")
+AFTER_ID = Query(None, description="Exporta solo filas con id mayor (extracciones incrementales)")
+
+
+# Recorre la consulta por tandas con su propia sesión y serializa cada tanda
+def _stream(stmt, formato: str) -> Iterator[str]:
+    with Session(engine) as session:
+        result = session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        columnas = list(result.keys())
+
+        if formato == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columnas)
+            for partition in result.partitions():
+                writer.writerows(partition)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for partition in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(columnas, row)), default=str, ensure_ascii=False) + "\n"
+                    for row in partition
+                )
+
+
+def _response(stmt, formato: str, nombre: str) -> StreamingResponse:
+    return StreamingResponse(
+        _stream(stmt, formato),
+        media_type=_MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'},
+    )
+
+
+# Clientes con su saldo materializado (orden por id)
+@router.get("/clients")
+def export_clients(formato: str = FORMATO, after_id: Optional[int] = AFTER_ID):
+    stmt = (
+        select(
+            Client.id,
+            Client.nombre,
+            Client.apellido,
+            Client.nro_documento,
+            Client.tipo_documento,
+            Client.nacionalidad,
+            Client.email,
+            Client.telefono,
+            Client.fecha_nacimiento,
+            Client.referral_code,
+            Client.referred_by_id,
+            ClientBalance.saldo_puntos,
+            ClientBalance.level_id,
+        )
+        .outerjoin(ClientBalance, ClientBalance.cliente_id == Client.id)
+        .order_by(Client.id)
+    )
+    if after_id is not None:
+        stmt = stmt.where(Client.id > after_id)
+    return _response(stmt, formato, "clients")
+
+
+# Bolsas de puntos; since/until filtran por fecha de asignación
+@router.get("/pointsbag")
+def export_pointsbag(
+    formato: str = FORMATO,
+    since: Optional[date] = Query(None, description="Fecha de asignación desde (inclusive)"),
+    until: Optional[date] = Query(None, description="Fecha de asignación hasta (inclusive)"),
+    after_id: Optional[int] = AFTER_ID,
+):
+    stmt = select(
+        PointsBag.id,
+        PointsBag.cliente_id,
+        PointsBag.fecha_asignacion,
+        PointsBag.fecha_caducidad,
+        PointsBag.puntos_asignados,
+        PointsBag.puntos_utilizados,
+        PointsBag.saldo_puntos,
+        PointsBag.puntos_vencidos,
+        PointsBag.monto_operacion,
+    ).order_by(PointsBag.id)
+    if since:
+        stmt = stmt.where(PointsBag.fecha_asignacion >= since)
+    if until:
+        stmt = stmt.where(PointsBag.fecha_asignacion <= until)
+    if after_id is not None:
+        stmt = stmt.where(PointsBag.id > after_id)
+    return _response(stmt, formato, "pointsbag")
+
+
+# Canjes (cabeceras con la descripción del concepto); since/until filtran por fecha
+@router.get("/pointsuse")
+def export_pointsuse(
+    formato: str = FORMATO,
+    since: Optional[date] = Query(None, description="Fecha del canje desde (inclusive)"),
+    until: Optional[date] = Query(None, description="Fecha del canje hasta (inclusive)"),
+    after_id: Optional[int] = AFTER_ID,
+):
+    stmt = (
+        select(
+            PointsUseHeader.id,
+            PointsUseHeader.cliente_id,
+            PointsUseHeader.concepto_id,
+            PointConcept.descripcion.label("concepto"),
+            PointsUseHeader.puntaje_utilizado,
+            PointsUseHeader.fecha,
+        )
+        .outerjoin(PointConcept, PointConcept.id == PointsUseHeader.concepto_id)
+        .order_by(PointsUseHeader.id)
+    )
+    if since:
+        stmt = stmt.where(PointsUseHeader.fecha >= since)
+    if until:
+        stmt = stmt.where(PointsUseHeader.fecha <= until)
+    if after_id is not None:
+        stmt = stmt.where(PointsUseHeader.id > after_id)
+    return _response(stmt, formato, "pointsuse")
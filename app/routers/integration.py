@@ -1,7 +1,14 @@
+import math
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlmodel import Session, select
 from app.db import get_session
 from app.models import Client, PointsBag, Product
+from app.core.balances import get_client_balance, refresh_client_balance
+from app.core.redemption import default_concept_id, redeem_points as consume_points
+from app.core.idempotency import run_idempotent
+from app.core.api_keys import ApiKeyRef, authenticate, consume
+from app.core.rollups import record_activity
 from datetime import datetime
 
 router = APIRouter(
@@ -9,18 +16,35 @@ router = APIRouter(
     tags=["Integración con Sistemas Externos"],
     responses={
         401: {"description": "No autorizado (API Key inválida)"},
+        429: {"description": "Límite de solicitudes de la API Key excedido"},
         404: {"description": "Recurso no encontrado"},
         500: {"description": "Error interno del servidor"}
     }
 )
 
-# 🔐 API KEY para sistemas externos
-API_KEY = "SECRET123"
+# 🔐 API KEYS para sistemas externos (ver /api-keys); cada llave tiene su token bucket
+def verify_api_key(
+    x_api_key: str = Header(..., description="Llave de autenticación del sistema externo"),
+    session: Session = Depends(get_session),
+) -> ApiKeyRef:
+    ref = authenticate(session, x_api_key)
+    if not ref:
+        raise HTTPException(status_code=401, detail="API Key inválida")
+    espera = consume(ref)
+    if espera:
+        raise HTTPException(
+            status_code=429,
+            detail="Límite de solicitudes excedido",
+            headers={"Retry-After": str(math.ceil(espera))},
+        )
+    return ref
 
 
-def verify_api_key(x_api_key: str = Header(..., description="Llave de autenticación del sistema externo")):
-    if x_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="API Key inválida")
+IDEMPOTENCY_HEADER = Header(
+    None,
+    alias="Idempotency-Key",
+    description="Clave única por operación; los reintentos con la misma clave devuelven la respuesta original",
+)
 
 
 # ------------------------------------------------------
@@ -70,15 +94,14 @@ def ping():
 def get_client_info(
     documento: str,
     session: Session = Depends(get_session),
-    _: str = Depends(verify_api_key)
+    _: ApiKeyRef = Depends(verify_api_key)
 ):
     cliente = session.exec(select(Client).where(Client.nro_documento == documento)).first()
 
     if not cliente:
         return {"success": False, "data": None, "error": "Cliente no encontrado"}
 
-    bolsas = session.exec(select(PointsBag).where(PointsBag.cliente_id == cliente.id)).all()
-    total = sum(b.saldo_puntos for b in bolsas)
+    total = get_client_balance(session, cliente.id).saldo_puntos
 
     return {
         "success": True,
@@ -122,8 +145,20 @@ def assign_points(
     cliente_id: int,
     monto_compra: float,
     session: Session = Depends(get_session),
-    _: str = Depends(verify_api_key)
+    api_key: ApiKeyRef = Depends(verify_api_key),
+    idempotency_key: Optional[str] = IDEMPOTENCY_HEADER,
 ):
+    return run_idempotent(
+        session,
+        f"{api_key.id}:points/assign",
+        idempotency_key,
+        {"cliente_id": cliente_id, "monto_compra": monto_compra},
+        lambda: _assign(session, cliente_id, monto_compra),
+    )
+
+
+# Asignación sin commit: la confirma run_idempotent junto con la respuesta guardada
+def _assign(session: Session, cliente_id: int, monto_compra: float) -> dict:
     cliente = session.get(Client, cliente_id)
 
     if not cliente:
@@ -142,8 +177,9 @@ def assign_points(
     )
 
     session.add(bolsa)
-    session.commit()
-    session.refresh(bolsa)
+    session.flush()
+    refresh_client_balance(session, cliente_id)
+    record_activity(session, bolsa.fecha_asignacion, puntos_asignados=puntos)
 
     return {
         "success": True,
@@ -186,8 +222,20 @@ def redeem_points(
     cliente_id: int,
     product_id: int,
     session: Session = Depends(get_session),
-    _: str = Depends(verify_api_key)
+    api_key: ApiKeyRef = Depends(verify_api_key),
+    idempotency_key: Optional[str] = IDEMPOTENCY_HEADER,
 ):
+    return run_idempotent(
+        session,
+        f"{api_key.id}:points/redeem",
+        idempotency_key,
+        {"cliente_id": cliente_id, "product_id": product_id},
+        lambda: _redeem(session, cliente_id, product_id),
+    )
+
+
+# Canje sin commit: la confirma run_idempotent junto con la respuesta guardada
+def _redeem(session: Session, cliente_id: int, product_id: int) -> dict:
     cliente = session.get(Client, cliente_id)
     producto = session.get(Product, product_id)
 
@@ -197,23 +245,12 @@ def redeem_points(
     if not producto:
         return {"success": False, "data": None, "error": "Producto no existe"}
 
-    bolsas = session.exec(select(PointsBag).where(PointsBag.cliente_id == cliente_id)).all()
-    total = sum(b.saldo_puntos for b in bolsas)
-
-    if total < producto.points_required:
-        return {"success": False, "data": None, "error": "Puntos insuficientes"}
-
-    puntos_usar = producto.points_required
-    for bolsa in bolsas:
-        if puntos_usar <= 0:
-            break
-        usar = min(bolsa.saldo_puntos, puntos_usar)
-        bolsa.saldo_puntos -= usar
-        bolsa.puntos_utilizados += usar
-        puntos_usar -= usar
-        session.add(bolsa)
-
-    session.commit()
+    # Mismo consumo FIFO que /pointsuse y /redeem
+    try:
+        consume_points(session, cliente_id, default_concept_id(session), producto.points_required)
+    except HTTPException as e:
+        session.rollback()
+        return {"success": False, "data": None, "error": e.detail}
 
     return {
         "success": True,
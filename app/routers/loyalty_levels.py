@@ -1,7 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
 from app.db import get_session
-from app.models import LoyaltyLevel, PointsBag
+from sqlalchemy import update
+from app.models import ClientBalance, LoyaltyLevel, PointsBag
+from app.core.balances import get_client_balance, refresh_levels
+from app.core.cache import bump_cache_version
+from app.core.level_index import LEVELS_CACHE, get_level, level_index
 from app.schemas import (
     LoyaltyLevelCreate,
     LoyaltyLevelUpdate,
@@ -19,7 +23,11 @@ def list_levels(session: Session = Depends(get_session)):
 def create_level(payload: LoyaltyLevelCreate, session: Session = Depends(get_session)):
     level = LoyaltyLevel(**payload.dict())
     session.add(level)
+    session.flush()
+    refresh_levels(session)
+    bump_cache_version(session, LEVELS_CACHE)
     session.commit()
+    level_index.invalidate()
     session.refresh(level)
     return level
 
@@ -33,7 +41,11 @@ def update_level(level_id: int, payload: LoyaltyLevelUpdate, session: Session =
         setattr(level, key, value)
 
     session.add(level)
+    session.flush()
+    refresh_levels(session)
+    bump_cache_version(session, LEVELS_CACHE)
     session.commit()
+    level_index.invalidate()
     session.refresh(level)
     return level
 
@@ -43,8 +55,16 @@ def delete_level(level_id: int, session: Session = Depends(get_session)):
     if not level:
         raise HTTPException(404, "Nivel no encontrado")
 
+    # libera las referencias antes de borrar el nivel
+    session.execute(
+        update(ClientBalance).where(ClientBalance.level_id == level_id).values(level_id=None)
+    )
     session.delete(level)
+    session.flush()
+    refresh_levels(session)
+    bump_cache_version(session, LEVELS_CACHE)
     session.commit()
+    level_index.invalidate()
     return {"message": "Nivel eliminado"}
 
 # Obtener nivel actual del cliente
@@ -52,21 +72,10 @@ from app.models import PointsBag, PointsUseDetail
 
 @router.get("/client/{client_id}", response_model=ClientLevelRead)
 def get_client_level(client_id: int, session: Session = Depends(get_session)):
-    # Obtener todas las bolsas del cliente
-    bolsas = session.exec(
-        select(PointsBag).where(PointsBag.cliente_id == client_id)
-    ).all()
-
-    # Calcular puntos totales disponibles
-    total = sum(b.saldo_puntos for b in bolsas) if bolsas else 0
-
-    # Buscar el nivel que le corresponde según min_points
-    stmt = (
-        select(LoyaltyLevel)
-        .where(LoyaltyLevel.min_points <= total)
-        .order_by(LoyaltyLevel.min_points.desc())
-    )
-    level = session.exec(stmt).first()
+    # Saldo materializado del cliente (lectura por clave primaria)
+    bal = get_client_balance(session, client_id)
+    total = bal.saldo_puntos
+    level = get_level(session, bal.level_id)
 
     return ClientLevelRead(
         client_id=client_id,
@@ -1,15 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from datetime import date, timedelta
 from typing import List, Optional
+from sqlalchemy import insert
 from sqlmodel import Session, select
-from ..db import get_session
-from ..models import PointsBag, Client, Rule, ExpirationParam, LoyaltyLevel
-from ..schemas import AssignPointsRequest, AssignPointsResponse
-from ..core.mailer import send_points_assigned_email, PointsAssignedEmail
-from ..schemas import AssignPointsResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..db import get_async_session, get_session, write_lock
+from ..models import PointsBag, Client, ExpirationParam
+from ..schemas import (
+    AssignPointsBatchItem,
+    AssignPointsBatchResponse,
+    AssignPointsRequest,
+    AssignPointsResponse,
+)
+from ..core.mailer import PointsAssignedEmail, render_points_assigned_email
+from ..core.outbox import enqueue_email, enqueue_emails
+from ..core.balances import refresh_client_balance, refresh_client_balances
+from ..core.rule_index import puntos_por_monto
+from ..core.level_index import get_level
+from ..core.rollups import record_activity
+from ..core.pagination import DEFAULT_LIMIT, MAX_LIMIT, keyset_page
 
 router = APIRouter(prefix="/pointsbag", tags=["Bolsa de puntos"])
 
+# Máximo de operaciones por llamada a /assign/batch
+MAX_BATCH_ITEMS = 5000
+
 # Obtener automáticamente el parámetro de vencimiento que está activo hoy
 def _get_expiration_settings(session: Session) -> ExpirationParam:
     hoy = date.today()
@@ -42,42 +57,10 @@ def _calc_expiry(exp: ExpirationParam, asignacion: date) -> date:
     return asignacion + timedelta(days=30)
 
 
-def _puntos_por_monto(session: Session, monto: int) -> int:
-    """
-    Usa la primera regla que coincida con el rango; si ninguna tiene rango, usa equivalencia general.
-    equivalencia_monto = cuántos puntos por cada X guaraníes.
-    """
-    reglas: List[Rule] = list(session.exec(select(Rule)))
-    if not reglas:
-        raise HTTPException(400, "No hay reglas de puntos configuradas.")
-
-    # prioriza las que tienen rango
-    for r in reglas:
-        if r.limite_inferior is not None and r.limite_superior is not None:
-            if r.limite_inferior <= monto <= r.limite_superior:
-                return monto // r.equivalencia_monto
-
-    # si no coinciden rangos, usa la primera equivalencia general
-    regla_general = next((r for r in reglas if r.limite_inferior is None and r.limite_superior is None), None)
-    if not regla_general:
-        # o en última instancia usa la primera regla
-        regla_general = reglas[0]
-    return monto // regla_general.equivalencia_monto
-
-# Asigna los puntos y crea la bolsa
-@router.post("/assign", response_model=AssignPointsResponse)
-async def assign_points(
-    payload: AssignPointsRequest,
-    background: BackgroundTasks,
-    session: Session = Depends(get_session),
-):
-    # valida cliente
-    cliente = session.get(Client, payload.cliente_id)
-    if not cliente:
-        raise HTTPException(404, "Cliente no encontrado")
-
+# Crea la bolsa y actualiza el saldo del cliente. No confirma la transacción.
+def _assign(session: Session, payload: AssignPointsRequest) -> AssignPointsResponse:
     # calcula puntos y vencimiento
-    puntos = _puntos_por_monto(session, payload.monto_operacion)
+    puntos = puntos_por_monto(session, payload.monto_operacion)
     hoy = date.today()
     exp = _get_expiration_settings(session)
     fecha_cad = _calc_expiry(exp, hoy)
@@ -93,40 +76,29 @@ async def assign_points(
         monto_operacion=payload.monto_operacion,
     )
     session.add(bag)
-    session.commit()
-    session.refresh(bag)
+    record_activity(session, hoy, puntos_asignados=puntos)
 
-    # calcula saldo total actual del cliente
-    hoy = date.today()
-    vigentes = session.exec(
-        select(PointsBag)
-        .where(PointsBag.cliente_id == payload.cliente_id)
-        .where(PointsBag.fecha_caducidad >= hoy)
-        .where(PointsBag.saldo_puntos > 0)
-    ).all()
-    saldo_sum = sum(b.saldo_puntos for b in vigentes)
-
-    # calcular nivel de fidelización según saldo_sum
-    stmt = (
-        select(LoyaltyLevel)
-        .where(LoyaltyLevel.min_points <= saldo_sum)
-        .order_by(LoyaltyLevel.min_points.desc())
-    )
-    level = session.exec(stmt).first()
-
-    # dispara email en background
-    # if cliente.email:
-    #     background.add_task(
-    #         send_points_assigned_email,
-    #         PointsAssignedEmail(
-    #             to=cliente.email,
-    #             nombre=f"{cliente.nombre} {cliente.apellido}".strip(),
-    #             puntos_asignados=puntos,
-    #             saldo_puntos=saldo_sum,
-    #             fecha_caducidad=str(fecha_cad),
-    #             monto_operacion=payload.monto_operacion,
-    #         ),
-    #     )
+    # actualiza el saldo materializado en la misma transacción
+    bal = refresh_client_balance(session, payload.cliente_id)
+
+    saldo_sum = bal.saldo_puntos
+    level = get_level(session, bal.level_id)
+
+    # aviso por email vía bandeja de salida (se envía solo si la transacción se confirma)
+    cliente = session.get(Client, payload.cliente_id)
+    if cliente and cliente.email:
+        enqueue_email(
+            session,
+            render_points_assigned_email(PointsAssignedEmail(
+                to=cliente.email,
+                nombre=f"{cliente.nombre} {cliente.apellido}".strip(),
+                puntos_asignados=puntos,
+                saldo_puntos=saldo_sum,
+                fecha_caducidad=str(fecha_cad),
+                monto_operacion=payload.monto_operacion,
+            )),
+            dedup_key=f"bolsa-asignada:{bag.id}",
+        )
 
     # devolver respuesta incluyendo nivel
     return AssignPointsResponse(
@@ -139,13 +111,123 @@ async def assign_points(
         level_name=level.name if level else None,
     )
 
-# listar las bolsas de puntos de cada cliente
+# Asigna los puntos y crea la bolsa
+@router.post("/assign", response_model=AssignPointsResponse)
+async def assign_points(
+    payload: AssignPointsRequest,
+    session: AsyncSession = Depends(get_async_session),
+):
+    # valida cliente
+    cliente = await session.get(Client, payload.cliente_id)
+    if not cliente:
+        raise HTTPException(404, "Cliente no encontrado")
+
+    # la lógica compartida es sync; run_sync la ejecuta sin bloquear el event loop
+    async with write_lock():
+        resultado = await session.run_sync(_assign, payload)
+        await session.commit()
+
+    return resultado
+
+# Asignación de un lote: reglas y vencimiento una vez, bolsas con un solo insert
+# y saldos de los clientes afectados con una consulta agrupada. No confirma la transacción.
+def _assign_batch(session: Session, items: List[AssignPointsRequest]) -> AssignPointsBatchResponse:
+    hoy = date.today()
+    fecha_cad = _calc_expiry(_get_expiration_settings(session), hoy)
+
+    ids = {i.cliente_id for i in items}
+    clientes = {
+        c.id: c for c in session.exec(select(Client).where(Client.id.in_(ids))).all()
+    }
+
+    resultados: List[AssignPointsBatchItem] = []
+    filas = []      # (resultado, valores de la bolsa)
+    for indice, item in enumerate(items):
+        resultado = AssignPointsBatchItem(indice=indice, ok=False, cliente_id=item.cliente_id)
+        resultados.append(resultado)
+        if item.cliente_id not in clientes:
+            resultado.error = "Cliente no encontrado"
+            continue
+        try:
+            puntos = puntos_por_monto(session, item.monto_operacion)
+        except HTTPException as e:
+            resultado.error = e.detail
+            continue
+        filas.append((resultado, dict(
+            cliente_id=item.cliente_id,
+            fecha_asignacion=hoy,
+            fecha_caducidad=fecha_cad,
+            puntos_asignados=puntos,
+            puntos_utilizados=0,
+            saldo_puntos=puntos,
+            monto_operacion=item.monto_operacion,
+        )))
+
+    if filas:
+        bag_ids = session.execute(
+            insert(PointsBag).returning(PointsBag.id, sort_by_parameter_order=True),
+            [valores for _, valores in filas],
+        ).scalars().all()
+        saldos = refresh_client_balances(session, {v["cliente_id"] for _, v in filas})
+        record_activity(session, hoy, puntos_asignados=sum(v["puntos_asignados"] for _, v in filas))
+
+        correos = []
+        for (resultado, valores), bag_id in zip(filas, bag_ids):
+            bal = saldos[resultado.cliente_id]
+            level = get_level(session, bal.level_id)
+            resultado.ok = True
+            resultado.bolsa_id = bag_id
+            resultado.puntos_asignados = valores["puntos_asignados"]
+            resultado.fecha_caducidad = fecha_cad
+            resultado.saldo_total = bal.saldo_puntos
+            resultado.level_id = level.id if level else None
+            resultado.level_name = level.name if level else None
+
+            cliente = clientes[resultado.cliente_id]
+            if cliente.email:
+                correos.append((
+                    render_points_assigned_email(PointsAssignedEmail(
+                        to=cliente.email,
+                        nombre=f"{cliente.nombre} {cliente.apellido}".strip(),
+                        puntos_asignados=valores["puntos_asignados"],
+                        saldo_puntos=bal.saldo_puntos,
+                        fecha_caducidad=str(fecha_cad),
+                        monto_operacion=valores["monto_operacion"],
+                    )),
+                    f"bolsa-asignada:{bag_id}",
+                ))
+        enqueue_emails(session, correos)
+
+    asignados = sum(1 for r in resultados if r.ok)
+    return AssignPointsBatchResponse(
+        asignados=asignados,
+        fallidos=len(resultados) - asignados,
+        resultados=resultados,
+    )
+
+# Asignación masiva (cierre de caja de las sucursales); resultado por ítem
+@router.post("/assign/batch", response_model=AssignPointsBatchResponse)
+async def assign_points_batch(
+    items: List[AssignPointsRequest],
+    session: AsyncSession = Depends(get_async_session),
+):
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(400, f"El lote admite hasta {MAX_BATCH_ITEMS} operaciones.")
+
+    async with write_lock():
+        resultado = await session.run_sync(_assign_batch, items)
+        await session.commit()
+    return resultado
+
+# listar las bolsas de puntos de cada cliente (más recientes primero, paginado por cursor)
 @router.get("", response_model=List[PointsBag])
 def list_bags(
+    request: Request,
+    response: Response,
     cliente_id: Optional[int] = None,
     solo_vigentes: bool = False,
-    limit: int = Query(50, ge=1, le=200),
-    offset: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
     session: Session = Depends(get_session),
 ):
     stmt = select(PointsBag)
@@ -154,5 +236,4 @@ def list_bags(
     if solo_vigentes:
         hoy = date.today()
         stmt = stmt.where(PointsBag.fecha_caducidad >= hoy).where(PointsBag.saldo_puntos > 0)
-    stmt = stmt.order_by(PointsBag.id.desc()).limit(limit).offset(offset)
-    return session.exec(stmt).all()
+    return keyset_page(session, request, response, stmt, [PointsBag.id], limit, cursor, descending=True)
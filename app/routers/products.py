@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from typing import Optional
 from sqlmodel import Session, select
 from app.models import Product
 from app.schemas import ProductCreate, ProductRead
 from app.db import engine, get_session
+from app.core.pagination import DEFAULT_LIMIT, MAX_LIMIT, keyset_page
 
 router = APIRouter(
     prefix="/products",
@@ -21,9 +23,14 @@ def create_product(product: ProductCreate, session: Session = Depends(get_sessio
 
 # Listar productos
 @router.get("/", response_model=list[ProductRead], summary="Listar productos")
-def list_products(session: Session = Depends(get_session)):
-    products = session.exec(select(Product)).all()
-    return products
+def list_products(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
+    session: Session = Depends(get_session),
+):
+    return keyset_page(session, request, response, select(Product), [Product.id], limit, cursor)
 
 
 # Obtener producto por ID
@@ -4,6 +4,8 @@ from sqlmodel import Session, select
 from ..db import get_session
 from ..models import Rule
 from ..schemas import RuleCreate
+from ..core.cache import bump_cache_version
+from ..core.rule_index import RULES_CACHE, rule_index
 
 router = APIRouter(prefix="/rules", tags=["Reglas"])
 
@@ -37,7 +39,9 @@ def create_rule(payload: RuleCreate, session: Session = Depends(get_session)):
     # Crear la nueva regla
     regla = Rule(**payload.dict())
     session.add(regla)
+    bump_cache_version(session, RULES_CACHE)
     session.commit()
+    rule_index.invalidate()
     session.refresh(regla)
     return regla
 
@@ -52,11 +56,15 @@ def update_rule(rule_id: int, payload: RuleCreate, session: Session = Depends(ge
     r = session.get(Rule, rule_id)
     if not r: raise HTTPException(404, "Regla no encontrada")
     for k, v in payload.dict().items(): setattr(r, k, v)
-    session.add(r); session.commit(); session.refresh(r); return r
+    session.add(r); bump_cache_version(session, RULES_CACHE); session.commit()
+    rule_index.invalidate()
+    session.refresh(r); return r
 
 # Eliminar una regla 
 @router.delete("/{rule_id}")
 def delete_rule(rule_id: int, session: Session = Depends(get_session)):
     r = session.get(Rule, rule_id)
     if not r: raise HTTPException(404, "Regla no encontrada")
-    session.delete(r); session.commit(); return {"ok": True}
+    session.delete(r); bump_cache_version(session, RULES_CACHE); session.commit()
+    rule_index.invalidate()
+    return {"ok": True}
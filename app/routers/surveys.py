@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlmodel import Session, select
 from app.db import get_session
 from app.models import Survey, Client
-from app.schemas import SurveyCreate, SurveyRead, SurveyWithClient
-from datetime import datetime
-from typing import List
+from app.schemas import ClientRead, SurveyCreate, SurveyRead, SurveyWithClient
+from app.core.pagination import DEFAULT_LIMIT, MAX_LIMIT, keyset_page
+from app.core.rollups import record_activity
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
 from app.models import Survey, Client
 
 router = APIRouter(prefix="/surveys", tags=["Encuestas"])
@@ -24,27 +26,59 @@ def create_survey(payload: SurveyCreate, session: Session = Depends(get_session)
         fecha=datetime.utcnow()
     )
     session.add(encuesta)
+    record_activity(session, encuesta.fecha.date(), encuestas=1, suma_puntuacion=encuesta.puntuacion)
     session.commit()
     session.refresh(encuesta)
     return encuesta
 
-# Listar todas las encuestas
+# Orden del listado: más recientes primero, sobre el índice (fecha, cliente_id)
+_ORDEN_ENCUESTAS = [Survey.fecha, Survey.cliente_id, Survey.id]
+
+# Listar encuestas con su cliente (una consulta con join por página)
 @router.get("", response_model=List[SurveyWithClient])
-def list_surveys(session: Session = Depends(get_session)):
-    encuestas = session.exec(select(Survey)).all()
-    result = []
-
-    for e in encuestas:
-        cliente = session.get(Client, e.cliente_id)
-        result.append({
-            "id": e.id,
-            "fecha": e.fecha,
-            "puntuacion": e.puntuacion,
-            "comentario": e.comentario,
-            "cliente": cliente
-        })
-
-    return result
+def list_surveys(
+    request: Request,
+    response: Response,
+    desde: Optional[date] = Query(None, description="Fecha desde (inclusive)"),
+    hasta: Optional[date] = Query(None, description="Fecha hasta (inclusive)"),
+    min_puntuacion: Optional[int] = Query(None, ge=1, le=5),
+    max_puntuacion: Optional[int] = Query(None, ge=1, le=5),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
+    session: Session = Depends(get_session),
+):
+    # solo las columnas que usa SurveyWithClient
+    stmt = select(
+        Survey.id,
+        Survey.fecha,
+        Survey.cliente_id,
+        Survey.puntuacion,
+        Survey.comentario,
+        Client.nombre,
+        Client.apellido,
+        Client.email,
+    ).join(Client, Client.id == Survey.cliente_id)
+
+    if desde:
+        stmt = stmt.where(Survey.fecha >= datetime.combine(desde, time.min))
+    if hasta:
+        stmt = stmt.where(Survey.fecha < datetime.combine(hasta + timedelta(days=1), time.min))
+    if min_puntuacion is not None:
+        stmt = stmt.where(Survey.puntuacion >= min_puntuacion)
+    if max_puntuacion is not None:
+        stmt = stmt.where(Survey.puntuacion <= max_puntuacion)
+
+    rows = keyset_page(session, request, response, stmt, _ORDEN_ENCUESTAS, limit, cursor, descending=True)
+    return [
+        SurveyWithClient(
+            id=r.id,
+            fecha=r.fecha,
+            puntuacion=r.puntuacion,
+            comentario=r.comentario,
+            cliente=ClientRead(id=r.cliente_id, nombre=r.nombre, apellido=r.apellido, email=r.email),
+        )
+        for r in rows
+    ]
 
 # Consultar encuestas por cliente
 @router.get("/cliente/{cliente_id}", response_model=List[SurveyRead])
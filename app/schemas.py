@@ -16,6 +16,15 @@ class ClientCreate(BaseModel):
     fecha_nacimiento: date
     codigo_referidor: Optional[str] = None   # Referidos
 
+class ClientImportError(BaseModel):
+    fila: int
+    error: str
+
+class ClientImportResult(BaseModel):
+    importados: int
+    total_errores: int
+    errores: List[ClientImportError]   # hasta IMPORT_MAX_ERRORS filas
+
 class ClientUpdate(BaseModel):
     telefono: Optional[str] = None
     email: Optional[EmailStr] = None
@@ -86,6 +95,24 @@ class AssignPointsRequest(BaseModel):
     cliente_id: int
     monto_operacion: int
 
+# Resultado por ítem de /pointsbag/assign/batch (en el orden recibido)
+class AssignPointsBatchItem(BaseModel):
+    indice: int
+    ok: bool
+    cliente_id: int
+    bolsa_id: Optional[int] = None
+    puntos_asignados: Optional[int] = None
+    fecha_caducidad: Optional[date] = None
+    saldo_total: Optional[int] = None      # saldo del cliente al terminar el lote
+    level_id: Optional[int] = None
+    level_name: Optional[str] = None
+    error: Optional[str] = None
+
+class AssignPointsBatchResponse(BaseModel):
+    asignados: int
+    fallidos: int
+    resultados: List[AssignPointsBatchItem]
+
 class PointsUseHeaderRead(BaseModel):
     id: int
     cliente_id: int
@@ -180,3 +207,38 @@ class SurveyWithClient(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+# LLAVES DE API (integración)
+class ApiKeyCreate(BaseModel):
+    nombre: str
+    rate_per_second: float = 10.0
+    burst: int = 20
+
+class ApiKeyUpdate(BaseModel):
+    nombre: Optional[str] = None
+    rate_per_second: Optional[float] = None
+    burst: Optional[int] = None
+    activo: Optional[bool] = None
+
+class ApiKeyRead(BaseModel):
+    id: int
+    nombre: str
+    prefijo: str
+    rate_per_second: float
+    burst: int
+    activo: bool
+    creado: datetime
+
+    class Config:
+        orm_mode = True
+
+class ApiKeyCreated(ApiKeyRead):
+    api_key: str   # se muestra una sola vez
+
+class ApiKeyUsage(BaseModel):
+    id: int
+    nombre: str
+    permitidas: int
+    rechazadas: int
+    ultimo_uso: Optional[datetime] = None
@@ -0,0 +1,132 @@
+"""
+Carga concurrente tipo caja (POS) contra un servidor en marcha: asignaciones de puntos
+(POST /pointsbag/assign) mezcladas con canjes (POST /pointsuse/use).
+
+Informa peticiones por segundo y latencias p50/p95/p99 por endpoint. Los datos de prueba
+(regla, vencimiento, concepto y clientes) se crean por la API al comenzar, así que sirve
+para comparar dos versiones del servidor sobre bases vacías.
+
+Requiere httpx (pip install httpx), que no es dependencia del servidor.
+
+Uso:
+    uvicorn app.main:app --port 8000          # en otra terminal, con una base de prueba
+    python scripts/bench_assign.py --url http://127.0.0.1:8000 [--concurrencia 32] [--peticiones 2000]
+
+Los canjes encolan o envían un comprobante por correo: apunte MAIL_SERVER/MAIL_PORT del
+servidor a un SMTP local o inexistente para no depender de la red.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+async def _preparar(client: httpx.AsyncClient, clientes: int) -> tuple:
+    run = uuid.uuid4().hex[:8]
+
+    async def post(url, json):
+        r = await client.post(url, json=json)
+        if r.status_code >= 400:
+            raise SystemExit(f"Falló la preparación {url}: {r.status_code} {r.text}")
+        return r.json()
+
+    await post("/rules", {"limite_inferior": 0, "limite_superior": 10_000_000, "equivalencia_monto": 1000})
+    await post("/expirations", {"fecha_inicio_validez": "2020-01-01", "dias_duracion": 90})
+    concepto = await post("/concepts", {"descripcion": f"Bench {run}", "puntos_requeridos": 5})
+
+    ids = []
+    for i in range(clientes):
+        c = await post("/clients", {
+            "nombre": f"Bench{i}", "apellido": run, "nro_documento": f"{run}-{i}",
+            "tipo_documento": "CI", "nacionalidad": "Paraguaya", "email": f"{run}.{i}@example.com",
+            "telefono": f"09{i:08d}", "fecha_nacimiento": "1990-01-01",
+        })
+        ids.append(c["id"])
+    return ids, concepto["id"]
+
+
+async def _correr(args) -> None:
+    limits = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        ids, concepto_id = await _preparar(client, args.clientes)
+        rnd = random.Random(args.semilla)
+
+        # plan fijo de operaciones para que dos corridas sean comparables
+        plan = []
+        for _ in range(args.peticiones):
+            cid = rnd.choice(ids)
+            if rnd.random() < args.canjes:
+                plan.append(("use", "/pointsuse/use", {"cliente_id": cid, "concepto_id": concepto_id}))
+            else:
+                plan.append(("assign", "/pointsbag/assign", {"cliente_id": cid, "monto_operacion": rnd.randint(5, 80) * 1000}))
+
+        latencias = defaultdict(list)
+        estados = defaultdict(Counter)
+        cola = iter(plan)
+
+        async def worker():
+            for nombre, url, body in cola:
+                inicio = time.perf_counter()
+                try:
+                    r = await client.post(url, json=body)
+                    estado = str(r.status_code)
+                except httpx.HTTPError as e:
+                    estado = type(e).__name__
+                latencias[nombre].append(time.perf_counter() - inicio)
+                estados[nombre][estado] += 1
+
+        # con --limite la corrida se corta aunque el servidor deje de responder
+        inicio = time.perf_counter()
+        tareas = [asyncio.ensure_future(worker()) for _ in range(args.concurrencia)]
+        _, pendientes = await asyncio.wait(tareas, timeout=args.limite)
+        for t in pendientes:
+            t.cancel()
+        duracion = time.perf_counter() - inicio
+
+    todas = [l for ls in latencias.values() for l in ls]
+    print(f"url={args.url} concurrencia={args.concurrencia} peticiones={len(todas)} duración={duracion:.2f}s")
+    if pendientes:
+        print(f"CORTADA a los {args.limite:.0f}s: {len(pendientes)} peticiones sin respuesta, "
+              f"{len(plan) - len(todas) - len(pendientes)} sin enviar")
+    if not todas:
+        return
+    print(f"total: {len(todas) / duracion:.1f} req/s  " + _resumen(todas))
+    for nombre in sorted(latencias):
+        print(f"{nombre:>7}: n={len(latencias[nombre])}  {_resumen(latencias[nombre])}  estados={dict(estados[nombre])}")
+
+
+def _resumen(valores) -> str:
+    return (
+        f"p50={statistics.median(valores) * 1000:.1f}ms "
+        f"p95={_percentil(valores, 95) * 1000:.1f}ms "
+        f"p99={_percentil(valores, 99) * 1000:.1f}ms"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrencia", type=int, default=32)
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--canjes", type=float, default=0.3, help="fracción de canjes en la mezcla")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--limite", type=float, default=None, help="duración máxima de la corrida (s)")
+    asyncio.run(_correr(parser.parse_args()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Envío de avisos por correo contra un SMTP local (aiosmtpd) que simula la demora de un
+servidor remoto: --latencia-conexion-ms al abrir la sesión (EHLO) y --latencia-envio-ms
+por mensaje (DATA). Cada --rechazo-cada mensajes hay un destinatario que el servidor rechaza.
+
+Compara el ciclo anterior del aviso de vencimiento (un mensaje por cliente con fastapi-mail,
+en serie, una conexión nueva por mensaje y sin capturar errores, así que el primer rechazo
+corta el resto; aquí se reproduce con aiosmtplib) con mailer.send_bulk (MAIL_CONCURRENCY
+conexiones reutilizadas y fallos aislados por destinatario).
+
+Requiere aiosmtpd (pip install aiosmtpd), que no es dependencia del servidor.
+
+Uso:
+    python scripts/bench_mail.py [--mensajes 500] [--concurrencia 4] [--modo anterior|bulk|ambos]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _Servidor:
+    """Handler de aiosmtpd con demoras fijas y destinatarios rechazados (prefijo "rechazo")."""
+
+    def __init__(self, latencia_conexion: float, latencia_envio: float):
+        self.latencia_conexion = latencia_conexion
+        self.latencia_envio = latencia_envio
+        self.conexiones = 0
+        self.entregados = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.conexiones += 1
+        session.host_name = hostname
+        await asyncio.sleep(self.latencia_conexion)
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("rechazo"):
+            return "550 Destinatario inexistente"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.latencia_envio)
+        self.entregados += len(envelope.rcpt_tos)
+        return "250 OK"
+
+
+# Ciclo anterior (send_points_expiring_email con fastapi-mail): una conexión por mensaje, sin reintentos
+async def _anterior(destinos, items) -> tuple:
+    from app.core.mailer import _mime, _smtp_close, _smtp_connect, render_points_expiring_email
+
+    enviados = 0
+    for to in destinos:
+        smtp = None
+        try:
+            smtp = await _smtp_connect()
+            await smtp.send_message(_mime(render_points_expiring_email(to, "Cliente", items)))
+            await _smtp_close(smtp)
+        except Exception as error:
+            await _smtp_close(smtp)
+            return enviados, f"{type(error).__name__} en el mensaje {enviados + 1}"
+        enviados += 1
+    return enviados, None
+
+
+async def _bulk(destinos, items, concurrencia) -> tuple:
+    from app.core.mailer import render_points_expiring_email, send_bulk
+
+    errores = await send_bulk(
+        [render_points_expiring_email(to, "Cliente", items) for to in destinos],
+        concurrency=concurrencia,
+    )
+    return sum(e is None for e in errores), sum(e is not None for e in errores)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mensajes", type=int, default=500)
+    parser.add_argument("--concurrencia", type=int, default=4, help="conexiones de send_bulk")
+    parser.add_argument("--latencia-conexion-ms", type=float, default=50.0)
+    parser.add_argument("--latencia-envio-ms", type=float, default=20.0)
+    parser.add_argument("--rechazo-cada", type=int, default=50, help="0 = sin rechazos")
+    parser.add_argument("--modo", choices=["anterior", "bulk", "ambos"], default="ambos")
+    args = parser.parse_args()
+
+    puerto = _puerto_libre()
+    # app.core.mailer lee la configuración SMTP al importarse
+    os.environ.update(
+        MAIL_SERVER="127.0.0.1", MAIL_PORT=str(puerto), MAIL_STARTTLS="False", MAIL_SSL_TLS="False",
+        MAIL_USE_CREDENTIALS="False", MAIL_USERNAME="bench@example.com", MAIL_FROM="bench@example.com",
+        MAIL_PASSWORD="-",
+    )
+    sys.path.insert(0, ROOT)
+
+    from aiosmtpd.controller import Controller
+
+    from app.core.mailer import PointsExpiringItem
+
+    items = [PointsExpiringItem(fecha_caducidad="2030-01-01", puntos=10)]
+    destinos = [
+        f"rechazo{i}@example.com" if args.rechazo_cada and i % args.rechazo_cada == args.rechazo_cada - 1
+        else f"cliente{i}@example.com"
+        for i in range(args.mensajes)
+    ]
+
+    print(
+        f"mensajes={args.mensajes} latencia conexión={args.latencia_conexion_ms:.0f}ms "
+        f"envío={args.latencia_envio_ms:.0f}ms rechazo cada={args.rechazo_cada or '-'}"
+    )
+    modos = ["anterior", "bulk"] if args.modo == "ambos" else [args.modo]
+    for modo in modos:
+        handler = _Servidor(args.latencia_conexion_ms / 1000, args.latencia_envio_ms / 1000)
+        controller = Controller(handler, hostname="127.0.0.1", port=puerto)
+        controller.start()
+        try:
+            inicio = time.perf_counter()
+            if modo == "anterior":
+                enviados, corte = asyncio.run(_anterior(destinos, items))
+                detalle = f"cortado: {corte}" if corte else "sin cortes"
+            else:
+                enviados, fallidos = asyncio.run(_bulk(destinos, items, args.concurrencia))
+                detalle = f"fallidos={fallidos} (aislados), concurrencia={args.concurrencia}"
+            duracion = time.perf_counter() - inicio
+        finally:
+            controller.stop()
+        print(
+            f"{modo:>8}: {duracion:6.2f}s  {enviados / duracion:6.1f} mensajes/s  enviados={enviados}/{args.mensajes} "
+            f"conexiones={handler.conexiones}  {detalle}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
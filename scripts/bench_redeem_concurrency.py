@@ -0,0 +1,212 @@
+"""
+Canjes concurrentes sobre un mismo cliente con app.core.redemption.redeem_points.
+
+Verifica que no se pierdan actualizaciones: al final, los puntos de las cabeceras, de los
+detalles, de las bolsas y el saldo materializado tienen que coincidir. Informa canjes por
+segundo y latencias. Usa una base SQLite temporal (o DATABASE_URL si se indica --url).
+
+--modo anterior repite el ciclo FIFO que tenía /pointsuse/use antes del servicio compartido
+(cabecera confirmada antes de los detalles y saldo de la bolsa asignado desde el ORM), para
+comparar. Ese ciclo no mantenía clientbalance, así que ese control no aplica.
+
+Uso:
+    python scripts/bench_redeem_concurrency.py [--threads 16] [--canjes 10] [--puntos 7] [--modo anterior]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Ciclo FIFO anterior al servicio compartido (copia de /pointsuse/use, sin el correo)
+def _canje_anterior(session, cliente_id: int, concepto_id: int, puntos: int) -> None:
+    from fastapi import HTTPException
+    from sqlmodel import select
+
+    from app.models import PointsBag, PointsUseDetail, PointsUseHeader
+
+    hoy = date.today()
+    bolsas = session.exec(
+        select(PointsBag)
+        .where(PointsBag.cliente_id == cliente_id)
+        .where(PointsBag.saldo_puntos > 0)
+        .where(PointsBag.fecha_caducidad >= hoy)
+        .order_by(PointsBag.fecha_asignacion.asc(), PointsBag.id.asc())
+    ).all()
+    if not bolsas or sum(b.saldo_puntos for b in bolsas) < puntos:
+        raise HTTPException(400, "Puntos insuficientes.")
+
+    cabecera = PointsUseHeader(cliente_id=cliente_id, concepto_id=concepto_id, puntaje_utilizado=puntos, fecha=hoy)
+    session.add(cabecera)
+    session.commit()
+    session.refresh(cabecera)
+
+    restante = puntos
+    for bolsa in bolsas:
+        if restante <= 0:
+            break
+        usar = min(bolsa.saldo_puntos, restante)
+        bolsa.saldo_puntos -= usar
+        bolsa.puntos_utilizados += usar
+        session.add(PointsUseDetail(cabecera_id=cabecera.id, bolsa_id=bolsa.id, puntaje_utilizado=usar))
+        session.add(bolsa)
+        restante -= usar
+    session.commit()
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--canjes", type=int, default=10, help="canjes por hilo")
+    parser.add_argument("--puntos", type=int, default=7, help="puntos por canje")
+    parser.add_argument("--bolsas", type=int, default=40)
+    parser.add_argument("--puntos-bolsa", type=int, default=25)
+    parser.add_argument("--url", help="base a usar en lugar de una SQLite temporal")
+    parser.add_argument("--modo", choices=["servicio", "anterior"], default="servicio")
+    args = parser.parse_args()
+
+    tmp = None
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/bench.db"
+    sys.path.insert(0, ROOT)
+
+    from fastapi import HTTPException
+    from sqlalchemy.exc import OperationalError
+    from sqlmodel import Session, func, select
+
+    from app.core.balances import refresh_client_balance
+    from app.core.redemption import redeem_points
+    from app.db import engine
+    from app.migrate import upgrade
+    from app.models import Client, ClientBalance, PointConcept, PointsBag, PointsUseDetail, PointsUseHeader
+
+    upgrade(engine)
+
+    # Cliente con varias bolsas vigentes (orden FIFO por fecha de asignación)
+    hoy = date.today()
+    with Session(engine) as session:
+        cliente = Client(
+            nombre="Bench", apellido="Canjes", nro_documento=f"bench-{time.time_ns()}",
+            tipo_documento="CI", nacionalidad="Paraguaya", email=f"bench-{time.time_ns()}@example.com",
+            telefono="0000", fecha_nacimiento=date(1990, 1, 1),
+        )
+        concepto = PointConcept(descripcion="Bench", puntos_requeridos=args.puntos)
+        session.add(cliente)
+        session.add(concepto)
+        session.flush()
+        for i in range(args.bolsas):
+            session.add(PointsBag(
+                cliente_id=cliente.id,
+                fecha_asignacion=hoy - timedelta(days=args.bolsas - i),
+                fecha_caducidad=hoy + timedelta(days=30),
+                puntos_asignados=args.puntos_bolsa,
+                saldo_puntos=args.puntos_bolsa,
+                monto_operacion=0,
+            ))
+        session.flush()
+        refresh_client_balance(session, cliente.id)
+        session.commit()
+        cliente_id, concepto_id = cliente.id, concepto.id
+
+    total_inicial = args.bolsas * args.puntos_bolsa
+    lock = threading.Lock()
+    resultados = {"ok": 0, "insuficientes": 0, "conflictos": 0, "bloqueos": 0}
+    latencias = []
+
+    def worker():
+        with Session(engine) as session:
+            for _ in range(args.canjes):
+                inicio = time.perf_counter()
+                estado = "ok"
+                try:
+                    if args.modo == "anterior":
+                        _canje_anterior(session, cliente_id, concepto_id, args.puntos)
+                    else:
+                        redeem_points(session, cliente_id, concepto_id, args.puntos)
+                        session.commit()
+                except HTTPException as e:
+                    session.rollback()
+                    estado = "insuficientes" if e.status_code == 400 else "conflictos"
+                except OperationalError:
+                    session.rollback()
+                    estado = "bloqueos"
+                with lock:
+                    resultados[estado] += 1
+                    latencias.append(time.perf_counter() - inicio)
+
+    hilos = [threading.Thread(target=worker) for _ in range(args.threads)]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    duracion = time.perf_counter() - inicio
+
+    # Consistencia: todos los registros deben contar los mismos puntos gastados
+    with Session(engine) as session:
+        cabeceras = session.exec(
+            select(func.coalesce(func.sum(PointsUseHeader.puntaje_utilizado), 0))
+            .where(PointsUseHeader.cliente_id == cliente_id)
+        ).one()
+        detalles = session.exec(
+            select(func.coalesce(func.sum(PointsUseDetail.puntaje_utilizado), 0))
+            .join(PointsUseHeader, PointsUseHeader.id == PointsUseDetail.cabecera_id)
+            .where(PointsUseHeader.cliente_id == cliente_id)
+        ).one()
+        utilizados, saldo_bolsas, saldo_minimo = session.exec(
+            select(
+                func.sum(PointsBag.puntos_utilizados),
+                func.sum(PointsBag.saldo_puntos),
+                func.min(PointsBag.saldo_puntos),
+            ).where(PointsBag.cliente_id == cliente_id)
+        ).one()
+        saldo_materializado = session.get(ClientBalance, cliente_id).saldo_puntos
+
+    gastado = resultados["ok"] * args.puntos
+    checks = {
+        "cabeceras": cabeceras == gastado,
+        "detalles": detalles == gastado,
+        "bolsas_utilizados": utilizados == gastado,
+        "bolsas_saldo": saldo_bolsas == total_inicial - gastado,
+        "saldo_materializado": saldo_materializado == total_inicial - gastado,
+        "sin_saldos_negativos": saldo_minimo >= 0,
+    }
+    if args.modo == "anterior":
+        del checks["saldo_materializado"]
+
+    intentos = args.threads * args.canjes
+    print(f"modo={args.modo} hilos={args.threads} canjes={intentos} puntos_por_canje={args.puntos} puntos_iniciales={total_inicial}")
+    print(f"resultados: {resultados}")
+    print(f"duración: {duracion:.2f}s  canjes/s: {intentos / duracion:.1f}")
+    print(
+        f"latencia ms: p50={statistics.median(latencias) * 1000:.1f} "
+        f"p99={_percentil(latencias, 99) * 1000:.1f} max={max(latencias) * 1000:.1f}"
+    )
+    print(f"gastado={gastado} cabeceras={cabeceras} detalles={detalles} utilizados={utilizados} "
+          f"saldo_bolsas={saldo_bolsas} saldo_materializado={saldo_materializado}")
+    print("consistencia:", "OK" if all(checks.values()) else f"FALLA {checks}")
+
+    engine.dispose()
+    if tmp:
+        tmp.cleanup()
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Contención de escritura en SQLite: varios hilos asignan puntos a la vez (la misma lógica que
+POST /pointsbag/assign) y se compara el motor sin ajustes con el perfil de app/db.py
+(WAL, synchronous=NORMAL, busy_timeout, cache_size, mmap_size).
+
+Cada perfil usa su propia base temporal. Informa asignaciones por segundo, latencias y
+cuántas transacciones fallaron con "database is locked".
+
+Uso:
+    python scripts/bench_sqlite_writes.py [--threads 16] [--asignaciones 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def _correr(nombre: str, engine, args) -> None:
+    from sqlalchemy.exc import OperationalError
+    from sqlmodel import Session, func, select
+
+    from app.core.balances import refresh_client_balance
+    from app.migrate import upgrade
+    from app.models import Client, ExpirationParam, PointsBag, Rule
+    from app.routers.pointsbag import _assign
+    from app.schemas import AssignPointsRequest
+
+    upgrade(engine)
+    with Session(engine) as session:
+        session.add(Rule(limite_inferior=0, limite_superior=10_000_000, equivalencia_monto=1000))
+        session.add(ExpirationParam(fecha_inicio_validez=date(2020, 1, 1), dias_duracion=90))
+        clientes = [
+            Client(
+                nombre=f"Bench{i}", apellido="Escrituras", nro_documento=f"w{i}", tipo_documento="CI",
+                nacionalidad="Paraguaya", email=f"w{i}@example.com", telefono="0000",
+                fecha_nacimiento=date(1990, 1, 1),
+            )
+            for i in range(args.clientes)
+        ]
+        session.add_all(clientes)
+        session.flush()
+        for c in clientes:
+            refresh_client_balance(session, c.id)
+        session.commit()
+        ids = [c.id for c in clientes]
+
+    lock = threading.Lock()
+    latencias, bloqueos = [], [0]
+
+    def worker(n: int):
+        with Session(engine) as session:
+            for i in range(args.asignaciones):
+                payload = AssignPointsRequest(cliente_id=ids[(n + i) % len(ids)], monto_operacion=25_000)
+                inicio = time.perf_counter()
+                try:
+                    _assign(session, payload)
+                    session.commit()
+                    ok = True
+                except OperationalError:
+                    session.rollback()
+                    ok = False
+                with lock:
+                    latencias.append(time.perf_counter() - inicio)
+                    if not ok:
+                        bloqueos[0] += 1
+
+    hilos = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    duracion = time.perf_counter() - inicio
+
+    with Session(engine) as session:
+        bolsas = session.exec(select(func.count()).select_from(PointsBag)).one()
+        modo = session.connection().exec_driver_sql("PRAGMA journal_mode").scalar()
+    engine.dispose()
+
+    intentos = args.threads * args.asignaciones
+    print(
+        f"{nombre:>10}: journal={modo} {bolsas / duracion:7.1f} asignaciones/s  "
+        f"p50={statistics.median(latencias) * 1000:.1f}ms p99={_percentil(latencias, 99) * 1000:.1f}ms  "
+        f"confirmadas={bolsas}/{intentos} 'database is locked'={bloqueos[0]}"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--asignaciones", type=int, default=50, help="asignaciones por hilo")
+    parser.add_argument("--clientes", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # app.db crea su engine con el perfil al importarse: se apunta a la base del perfil
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/perfil.db"
+        sys.path.insert(0, ROOT)
+        from sqlmodel import create_engine
+
+        from app.db import engine as engine_perfil
+
+        # motor como estaba antes del perfil: solo check_same_thread
+        engine_base = create_engine(f"sqlite:///{tmp}/sin_perfil.db", connect_args={"check_same_thread": False})
+
+        print(f"hilos={args.threads} asignaciones por hilo={args.asignaciones} clientes={args.clientes}")
+        _correr("sin perfil", engine_base, args)
+        _correr("perfil", engine_perfil, args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())